@@ -1,67 +1,106 @@
+import atexit
 import json
-import multiprocessing
-import random
 import itertools
 import os.path
-from collections import deque
-import gc
 
 import numpy as np
-import caffe
 import matplotlib.pyplot as plt
 from PIL import Image
 import time
-import psutil
 import subprocess
+import sys
 
 from constants import *
 import experience_loader
+import atari_actions
 import utils
 from ntsc_palette import NTSCPalette
+from preprocess import FramePreprocessor
+from frame_reader import FrameReader
+from episode_writer import EpisodeWriter
 from create_action_sidebar import ActionSidebarImages
+from replay import ReplayMemory, PrioritizedReplayMemory, StratifiedReplayMemory
+from shared_replay import SharedReplayMemory
 import secrets
 
-MAX_HISTORY_LENGTH = 1000000
-
 
 if INTEGRATE_HUMAN_FEEDBACK:
     experience_pairs = experience_loader.get_queue()
+    replay_memory = None
 else:
-    # This size ends up being cut down considerably due to check_mem,
-    # need to implement multiprocessing queue to load from disk as with
-    # integrate experiences above.
-    experience_pairs = deque(maxlen=MAX_HISTORY_LENGTH)
+    experience_pairs = None
+    if (REPLAY_SHM_NAME or NUM_ENVS > 1) and \
+            (PRIORITIZED_REPLAY or REPLAY_CLASS_QUOTAS or REPLAY_DIR):
+        # Shared replay regions are uniform, and live in /dev/shm or RAM.
+        raise Exception('PRIORITIZED_REPLAY, REPLAY_CLASS_QUOTAS and '
+                        'REPLAY_DIR are not supported with REPLAY_SHM_NAME '
+                        'or NUM_ENVS > 1')
+    if REPLAY_SHM_NAME:
+        # One region per emulator of every actor.
+        replay_memory = SharedReplayMemory(REPLAY_SHM_NAME,
+                                           NUM_ACTORS * NUM_ENVS,
+                                           ACTOR_ID * NUM_ENVS)
+    elif NUM_ENVS > 1:
+        replay_memory = SharedReplayMemory(None, NUM_ENVS)
+    elif PRIORITIZED_REPLAY:
+        replay_memory = PrioritizedReplayMemory(directory=REPLAY_DIR)
+    elif REPLAY_CLASS_QUOTAS:
+        replay_memory = StratifiedReplayMemory(
+            directory=REPLAY_DIR,
+            quotas=[float(q) for q in REPLAY_CLASS_QUOTAS.split(',')])
+    else:
+        replay_memory = ReplayMemory(directory=REPLAY_DIR)
+
+# One writer thread for the recordings of every emulator in the process.
+episode_writer = EpisodeWriter()
+atexit.register(episode_writer.stop)
 
 
 class Atari(object):
-    def __init__(self, log_dir_name, episode_num, start_timestamp, show=False):
-        self.experience_pairs = experience_pairs
+    def __init__(self, log_dir_name, episode_num, start_timestamp, show=False,
+                 env_id=None):
+        """ env_id: index of this emulator in a VectorAtari, which gets its
+        own FIFO directory and replay region. """
+        self.replay_memory = replay_memory
+        if isinstance(replay_memory, SharedReplayMemory):
+            # Episodes of each emulator go to their own region.
+            self.replay_region = replay_memory.regions[
+                ACTOR_ID * NUM_ENVS + (env_id or 0)]
+        else:
+            self.replay_region = replay_memory
         self.log_dir_name = log_dir_name
         self.episode_num = episode_num
         self.start_timestamp = start_timestamp
         self.show = show
+        self.env_id = env_id
+        self.fifo_dir = get_fifo_dir(ACTOR_ID, env_id or 0)
         self.process = self.launch()
         print 'pid: ', self.process.pid
         self.game_over = False
-        self.fin  = open('/s/ale_0.4.4/ale_0_4/ale_fifo_out', 'w+')
-        self.fout = open('/s/ale_0.4.4/ale_0_4/ale_fifo_in',  'w+')
+        self.fin  = open(os.path.join(self.fifo_dir, 'ale_fifo_out'), 'w+')
+        self.fout = open(os.path.join(self.fifo_dir, 'ale_fifo_in'),  'w+')
         self.i = 0
         self.palette = NTSCPalette()
         self.previous_experience = None
         self.previous_recorded = False
         self.record_rewarding = False
-        self.log_file_name = '/frames_' + str(episode_num)
-        self.log_file_path = log_dir_name + self.log_file_name
+        self.log_file_name = self.get_log_file_name(episode_num)
         # Handshake
         self.width, self.height = self.read_width_height()
         self.write('1,0,0,1\n')  # Ask to send (screen, RAM, n/a, episode)
         self.action_images = ActionSidebarImages()
-        self.experiences = []
+        self.preprocessor = FramePreprocessor(
+            self.palette.gray, self.action_images.images,
+            in_shape=(self.height, self.width))
         self.recording   = []
+        if ASYNC_FRAME_READ:
+            self.frame_reader = FrameReader(self.fin, self.decode_screen)
+        else:
+            self.frame_reader = None
 
     def launch(self):
-        ale_location = "/s/ale_0.4.4/ale_0_4/"
-        rom_location = "roms/"
+        ale_location = ALE_DIR
+        rom_location = ALE_DIR + "roms/"
         ale_bin_file = "ale"
         rom_file = 'space_invaders.bin'
         # Run A.L.E
@@ -71,15 +110,22 @@ class Atari(object):
             show_arg = 'false'
         args = [
             ale_location + ale_bin_file,
-            '-run_length_encoding', 'false',
+            '-run_length_encoding', 'true' if RUN_LENGTH_ENCODING else 'false',
             '-display_screen',      show_arg,
             '-game_controller',     'fifo_named',
             '-frame_skip',          '3',  # TODO: Change to 4 for other games per dqn paper.
             rom_location + rom_file
         ]
+        if FAKE_ALE is not None:
+            # Deterministic stand-in speaking the same FIFO protocol, seeded
+            # differently for each emulator.
+            seed = ACTOR_ID * NUM_ENVS + (self.env_id or 0)
+            args = [sys.executable, DQN_ROOT + '/fake_ale.py'] + args[1:] + \
+                ['-seed', str(seed)] + FAKE_ALE.split()
         if not INTEGRATE_HUMAN_FEEDBACK:
-            self.check_memory()
-        return subprocess.Popen(args, cwd='/s/ale_0.4.4/ale_0_4/', close_fds=True)
+            self.print_replay_stats()
+        # ALE opens its named pipes in its working directory.
+        return subprocess.Popen(args, cwd=self.fifo_dir, close_fds=True)
 
     # def get_random_feedback(self):
     #     pairs = []
@@ -93,38 +139,53 @@ class Atari(object):
     #         ret.append([self.deserialize(e1), self.deserialize(e2)])
     #     return ret
 
-    def check_memory(self):
-        mem_pct = psutil.phymem_usage().percent
-        print 'mem pct is ', mem_pct, 'pairs length', len(self.experience_pairs)
-        if mem_pct > 80:
-            trim = int(len(self.experience_pairs) / 2.0)
-            for _ in xrange(trim):
-                try:
-                    self.experience_pairs.popleft()
-                except Exception, e:
-                    import traceback
-                    print e
-                    print traceback.print_exc()
-            gc.collect()
-
-    def add_action_sidebar(self, image, action):
-        action_image = self.action_images.images[action.value]
-        action_image = np.array(action_image, dtype=np.float64)
-
-        return np.concatenate((image, action_image), axis=1)
+    def print_replay_stats(self):
+        replay = self.replay_memory
+        print 'replay steps', len(replay), 'of', replay.capacity, \
+              'bytes', replay.resident_bytes, 'of', replay.capacity_bytes, \
+              'evictions', replay.evictions
+
+    def reset(self, episode_num):
+        """ Start the next episode in the running emulator with ALE's reset
+        action, keeping the process and FIFOs alive. """
+        self.log_episode()
+        # ALE is waiting on an action for the frame after the last one read.
+        self.read_frame()
+        self.send_action(atari_actions.RESET)
+        self.game_over = False
+        self.episode_num = episode_num
+        self.log_file_name = self.get_log_file_name(episode_num)
+        self.previous_experience = None
+        self.recording = []
 
     def stop(self):
-        utils.close_named_pipe(self.fin)
-        utils.close_named_pipe(self.fout)
+        """ Shut the emulator down for good. """
+        if self.frame_reader:
+            self.frame_reader.stop()
         pid = self.process.pid
         self.process.kill()  # kill -9 !!!!!!!!!!!!!!!!!!!!
         self.process.wait()
         while utils.check_pid(pid):
             print 'waiting for game to die'
             time.sleep(0.01)  # 10 millis
-        if not INTEGRATE_HUMAN_FEEDBACK:
+        if self.frame_reader:
+            # Closing fin while the reader is blocked on it hangs.
+            self.frame_reader.join()
+        utils.close_named_pipe(self.fin)
+        utils.close_named_pipe(self.fout)
+        self.log_episode()
+        episode_writer.join()
+
+    def log_episode(self):
+        if RECORD_EPISODES and not INTEGRATE_HUMAN_FEEDBACK:
             # We've already recorded this game if we are integrating feedback.
-            self.log_frames()  # Keep this at end to avoid stalling atari close.
+            # Serialize in the background so the next episode isn't stalled.
+            episode_writer.put(self.log_frames, self.recording,
+                               self.log_file_name, self.episode_num)
+
+    @staticmethod
+    def get_log_file_name(episode_num):
+        return '/frames_' + str(episode_num)
 
     def read_width_height(self):
         str_in = self.read()
@@ -139,6 +200,16 @@ class Atari(object):
     def read(self):
         return self.fin.readline().strip()
 
+    def read_frame(self):
+        """ Returns (screen, episode) of the next frame, screen being palette
+        indices. """
+        if self.frame_reader:
+            return self.frame_reader.get()
+        # screen_hex = width x height x 2-Hex-NTSC-color, or runs of
+        # 2-Hex-NTSC-color 2-Hex-length when run length encoded
+        screen_hex, episode, _ = self.read().split(':')
+        return self.decode_screen(screen_hex), episode  # Half the size.
+
     def write(self, s):
         self.fout.write(s)
         self.fout.flush()
@@ -156,7 +227,7 @@ class Atari(object):
     def send_action(self, action):
         self.write("%d,%d\n" % (action.value, 18))  # 18 = Noop player b.
 
-    def get_random_transition_pairs(self, num):
+    def get_random_transition_batch(self, num):
         if INTEGRATE_HUMAN_FEEDBACK:
             time1 = time.time()
             ret = experience_pairs.get()
@@ -164,12 +235,13 @@ class Atari(object):
             print '%s function took %0.3f ms' % \
                   ('queue-get', (time2 - time1) * 1000.0)
             return ret
+        elif len(self.replay_memory) > num:
+            return self.replay_memory.sample(num)
         else:
-            if len(self.experience_pairs) > num:
-                i = random.randint(0, len(self.experience_pairs) - num)
-                return list(itertools.islice(self.experience_pairs, i, i + num))
-            else:
-                return []
+            return None
+
+    def update_priorities(self, batch, td_errors):
+        self.replay_memory.update_priorities(batch.slots, td_errors)
 
     # def record_rewarding_experience(self, experience_pair, total_reward):
     #     if self.previous_experience and total_reward != 0 or self.game_over:
@@ -177,15 +249,32 @@ class Atari(object):
     #         # a reward.
     #         self.rewarding_experience_pairs.append(experience_pair)
 
-    def experience(self, n, action):
-        total_reward = 0
+    def experience(self, n, action, out=None):
+        """ out: optional (n, 84, 84) float32 array to preprocess into, such
+        as a state of the net's input. Frames in the returned experience are
+        then views of out, only valid until it is next written. """
+        raw_frames = [self.experience_frame(action)
+                      for _ in itertools.repeat(None, n)]
+        # Preprocess the whole frame-skip window at once.
+        images = self.preprocessor.process([f[0] for f in raw_frames],
+                                           [action.value] * n, out)
+        return self.assemble_experience(action, raw_frames, images)
+
+    def assemble_experience(self, action, raw_frames, images):
+        """ Experience from a window of experience_frame results and their
+        preprocessed images, recorded and stored in replay memory. """
+        n = len(raw_frames)
+        self.show_checkpoint_image(images[-1])
+        if self.show:
+            self.im = images[-1]
+        self.i += n
         ret = []
         frames = []
-        for _ in itertools.repeat(None, n):
-            reward, experience, frame = self.experience_frame(action)
-            total_reward += reward
-            ret.append(experience)
-            frames.append(frame)
+        for image_action, (screen, game_over, reward) in zip(images, raw_frames):
+            ret.append((image_action, action, game_over, reward))
+            # Images are recreated from the screen when serializing, as they
+            # may be overwritten by then.
+            frames.append((None, action, game_over, reward, screen))
         if INTEGRATE_HUMAN_FEEDBACK:
 
             pass
@@ -195,46 +284,47 @@ class Atari(object):
         return ret
 
     def store_experience(self, frames, ret):
-        self.experiences.append(ret)
-        self.recording.append(frames)
-        if self.previous_experience:
-            experience_pair = (self.previous_experience, ret)
-            self.experience_pairs.append(experience_pair)
-            # if self.record_rewarding:
-            # self.record_rewarding_experience(experience_pair, total_reward)
+        if RECORD_EPISODES:
+            self.recording.append(frames)
+        self.replay_region.append(ret, linked=bool(self.previous_experience))
         self.previous_experience = ret
 
-    def log_frames(self):
+    def log_frames(self, recording, log_file_name, episode_num):
+        # Takes the episode's state as arguments since the emulator moves on
+        # to the next episode while this runs.
         serialized_frames = []
-        for frames in self.recording:
+        for frames in recording:
             serialized_frames.append(self.serialize(frames))
-        with open(self.log_file_path, 'wb') as log_file:
+        with open(self.log_dir_name + log_file_name, 'wb') as log_file:
             log_file.write('aiworldFrames = ')
             json.dump({
                 'start'   : self.start_timestamp,
-                'episode' : self.episode_num,
+                'episode' : episode_num,
                 'frames'  : serialized_frames
             }, log_file)
-        self.zip_and_delete()
+        self.zip_and_delete(log_file_name, episode_num)
 
     def serialize(self, frames):
         ret = []
-        for frame in frames:
+        images = self.preprocessor.process(
+            [frame[EXP_SCREEN_INDEX] for frame in frames],
+            [frame[EXP_ACTION_INDEX].value for frame in frames])
+        for image_action, frame in zip(images, frames):
             ret.append({
-                'image_action' : frame[EXP_IMAGE_ACTION_INDEX].tolist(),
+                'image_action' : image_action.tolist(),
                 'action'       : frame[EXP_ACTION_INDEX].name,
                 'game_over'    : frame[EXP_GAME_OVER_INDEX],
                 'reward'       : frame[EXP_REWARD_INDEX],
-                'screen_hex'   : frame[EXP_SCREEN_HEX_INDEX]
+                'screen_hex'   : utils.indices_to_screen_hex(frame[EXP_SCREEN_INDEX])
             })
         return ret
 
-    def zip_and_delete(self):
+    def zip_and_delete(self, log_file_name, episode_num):
         sp = subprocess.Popen([DQN_ROOT + '/zip_and_delete.bash',
                                self.log_dir_name,
-                               self.log_file_name,
+                               log_file_name,
                                str(self.start_timestamp),
-                               str(self.episode_num),
+                               str(episode_num),
                                secrets.DQN_AWS_ID,
                                secrets.DQN_AWS_SECRET], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         out, err = sp.communicate()
@@ -246,17 +336,13 @@ class Atari(object):
 
     def experience_frame(self, action):
         """ Load frame from game video.
-        Returns: (image, action, game_over, reward)
+        Returns: (screen, game_over, reward), screen being palette indices
+        for the preprocessor.
         """
-        # screen_hex = width x height x 2-Hex-NTSC-color
-        screen_hex, episode, _ = self.read().split(':')
-        image = self.get_image_from_screen_hex(screen_hex)
-        image_action = self.add_action_sidebar(image, action)
+        screen, episode = self.read_frame()
         game_over, reward = self.get_game_over_and_reward(episode)
-        experience = (image_action, action, game_over, reward)
-        frame      = (image_action, action, game_over, reward, screen_hex)
         self.send_action(action)
-        return reward, experience, frame
+        return screen, game_over, reward
 
     def get_reward_from_experience(self, experience):
         """Returns sum of rewards
@@ -287,20 +373,15 @@ class Atari(object):
     def get_state_from_experience(self, experience):
         return [e[EXP_IMAGE_ACTION_INDEX] for e in experience]
 
-    def get_action_from_experience(self, experience):
-        return experience[0][EXP_ACTION_INDEX]
-
-    def substitute_reward_in_experience(self, experience, reward):
-        k = EXP_REWARD_INDEX
-        ret = []
-        for f in experience:
-            f = list(f)
-            x = tuple(f[:k] + [reward] + f[k + 1:])
-            ret.append(x)
-        return ret
-
     """ Simulator parsing """
 
+    def decode_screen(self, screen_hex):
+        if RUN_LENGTH_ENCODING:
+            return utils.rle_screen_hex_to_indices(screen_hex,
+                                                   self.width * self.height)
+        else:
+            return utils.screen_hex_to_indices(screen_hex)
+
     def get_game_over_and_reward(self, episode):
         # From ALE manual.pdf:
         # The episode string contains two comma-separated integers
@@ -312,32 +393,18 @@ class Atari(object):
         self.game_over = game_over
         return game_over, reward
 
-    def get_image_from_screen_hex(self, screen_hex):
-        """ Returns w x h x gray_level """
-        colors = []
-        for color in color_chunks(screen_hex):
-            colors.append(self.palette.colors[int(color, 16)])  # 16 For 2-hex
-
-        # Reshape flat to h x w x RGB
-        im = np.reshape(np.array(colors), (self.height, self.width, 3))
-
-        # self.show_image(im)
-
-        im = utils.rgb2gray(im)
-        # Resize to dimensions in DQN paper, TODO: pass dims as param.
-        im = caffe.io.resize_image_binary(im, (84, 80))
-        self.show_checkpoint_image(im)
-        if self.show:
-            self.im = im
-        self.i += 1
-        return im
-
 
-def color_chunks(l):
-    """ Yield successive 2-hex chunks from l.
-    """
-    for i in xrange(0, len(l), 2):
-        yield l[i: i + 2]
+def get_fifo_dir(actor_id, env_id):
+    """ Directory with the named pipe pair of one emulator, distinct for
+    every emulator of every actor process on the host. """
+    ret = os.path.join(ALE_FIFO_ROOT, 'actor_%d' % actor_id, 'env_%d' % env_id)
+    if not os.path.exists(ret):
+        os.makedirs(ret)
+    for name in ['ale_fifo_out', 'ale_fifo_in']:
+        path = os.path.join(ret, name)
+        if not os.path.exists(path):
+            os.mkfifo(path)
+    return ret
 
 
 if __name__ == '__main__':
@@ -0,0 +1,118 @@
+"""
+Reproducible actor/learner throughput against the fake_ale.py stand-in.
+
+Run from examples/dqn, e.g.
+    python benchmark_loop.py --steps 1000 --envs 4 --learn
+Extra fake_ale.py flags (-fps, -episode_frames, -screens) go in FAKE_ALE.
+Reports steps per second, time per step spent in the emulator round trip
+and preprocessing, frame decode cost and, with --learn, the learner's
+perceive and replay update latency.
+"""
+import argparse
+import os
+import tempfile
+import time
+import timeit
+
+parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+parser.add_argument('--steps', type=int, default=500)
+parser.add_argument('--envs',  type=int, default=1, help='emulators (NUM_ENVS)')
+parser.add_argument('--learn', action='store_true',
+                    help='also run the solver, needs pycaffe')
+args = parser.parse_args()
+
+# Must be set before constants are imported.
+os.environ.setdefault('FAKE_ALE', '')
+os.environ.setdefault('REPLAY_BYTES', str(2 ** 30))
+os.environ['NUM_ENVS'] = str(args.envs)
+os.environ['NO_RECORD_EPISODES'] = '1'
+
+import numpy as np
+
+from constants import RUN_LENGTH_ENCODING
+import atari_actions as actions
+from atari import Atari
+from vector_atari import VectorAtari
+from fake_ale import FakeAle, encode_screen
+import utils
+
+EXPERIENCE_WINDOW_SIZE = 4
+
+
+def report(name, seconds, count):
+    print '%-24s %9.3f ms' % (name, np.sum(seconds) * 1000.0 / count)
+
+
+def benchmark_decode(atari):
+    """Decode and preprocess cost of one generated screen."""
+    env = atari[0] if isinstance(atari, VectorAtari) else atari
+    screen = FakeAle(seed=0).get_screen()
+    screen_hex = encode_screen(screen, RUN_LENGTH_ENCODING)
+    number = 1000
+    report('decode per frame',
+           timeit.timeit(lambda: env.decode_screen(screen_hex), number=number),
+           number)
+    screens = [screen] * EXPERIENCE_WINDOW_SIZE
+    out = env.preprocessor.allocate(EXPERIENCE_WINDOW_SIZE)
+    report('preprocess per frame',
+           timeit.timeit(lambda: env.preprocessor.process(
+               screens, [0] * EXPERIENCE_WINDOW_SIZE, out), number=number),
+           number * EXPERIENCE_WINDOW_SIZE)
+
+
+def go():
+    log_dir_name = tempfile.mkdtemp()
+    if args.envs > 1:
+        atari = VectorAtari(args.envs, log_dir_name, int(time.time()))
+        envs = atari.envs
+    else:
+        atari = Atari(log_dir_name, 0, int(time.time()))
+        envs = [atari]
+    dqn = None
+    if args.learn:
+        from dqn_solver import DqnSolver
+        solver = utils.get_solver(None)
+        dqn = DqnSolver(atari, solver.net, solver, int(time.time()), 0)
+    env_actions = [actions.MOVE_RIGHT_AND_FIRE] * len(envs)
+    experience_times, perceive_times, learn_times = [], [], []
+    start = time.time()
+    for step in xrange(args.steps):
+        time1 = time.time()
+        if args.envs > 1:
+            _, states = atari.experience(EXPERIENCE_WINDOW_SIZE, env_actions)
+        else:
+            experience = atari.experience(EXPERIENCE_WINDOW_SIZE,
+                                          env_actions[0])
+            states = [atari.get_state_from_experience(experience)]
+        time2 = time.time()
+        experience_times.append(time2 - time1)
+        if dqn:
+            perceived = dqn.perceive_batch(states)
+            time3 = time.time()
+            dqn.learn_from_experience_replay()
+            time4 = time.time()
+            perceive_times.append(time3 - time2)
+            learn_times.append(time4 - time3)
+        # Same exploration sequence for every run.
+        env_actions = [actions.ALL.values()[(step + i) % len(actions.ALL)]
+                       for i in xrange(len(envs))]
+        for i, env in enumerate(envs):
+            if env.game_over:
+                env.reset(step * len(envs) + i)
+    elapsed = time.time() - start
+    for env in envs:
+        env.process.kill()
+        env.process.wait()
+
+    print '%d steps of %d emulators in %0.1f s' % (args.steps, len(envs),
+                                                   elapsed)
+    print '%-24s %9.1f' % ('steps per second', args.steps * len(envs) / elapsed)
+    report('experience per step', experience_times, args.steps)
+    if dqn:
+        report('perceive per step', perceive_times, args.steps)
+        report('learn per step', learn_times, args.steps)
+    benchmark_decode(atari)
+
+
+if __name__ == '__main__':
+    go()
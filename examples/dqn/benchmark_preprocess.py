@@ -0,0 +1,78 @@
+"""
+Compare the precomputed Downsampler with the skimage resize it replaces, and
+time FramePreprocessor on growing batches of screens.
+
+Run from examples/dqn: python benchmark_preprocess.py
+"""
+import binascii
+import timeit
+
+import numpy as np
+import skimage.transform
+
+from preprocess import Downsampler, FramePreprocessor, RESIZED_HEIGHT, \
+    RESIZED_WIDTH
+
+# Gray levels are 0-255, so this is well under one level.
+TOLERANCE = 1E-3
+NUMBER    = 200
+BATCH     = 32
+
+
+def skimage_resize(im):
+    # What caffe.io.resize_image_binary does.
+    return skimage.transform.resize(im, (RESIZED_HEIGHT, RESIZED_WIDTH),
+                                    order=1)
+
+
+def get_frames():
+    """The sample screen's palette indices as gray levels, plus noise frames
+    to exercise every interpolation weight."""
+    screen = np.fromstring(binascii.unhexlify(open('screen_hex').read().strip()),
+                           dtype=np.uint8).reshape(210, 160)
+    ret = [screen.astype(np.float64)]
+    ret += [np.random.uniform(0, 255, (210, 160)) for _ in xrange(BATCH - 1)]
+    return ret
+
+
+def timed(name, func, number=NUMBER):
+    ms = timeit.timeit(func, number=number) / number * 1000.0
+    print '%-28s %8.3f ms' % (name, ms)
+    return ms
+
+
+def go():
+    frames = get_frames()
+    batch = np.array(frames, dtype=np.float32)
+    downsampler = Downsampler()
+
+    expected = np.array([skimage_resize(f) for f in frames])
+    actual = downsampler.resize(batch)
+    error = np.abs(expected - actual).max()
+    print 'max abs difference from skimage: %g' % error
+    if error > TOLERANCE:
+        raise Exception('downsampler differs from skimage by %g' % error)
+
+    out = np.empty((RESIZED_HEIGHT, RESIZED_WIDTH), dtype=np.float32)
+    batch_out = np.empty((BATCH, RESIZED_HEIGHT, RESIZED_WIDTH), dtype=np.uint8)
+    before = timed('skimage, one frame', lambda: skimage_resize(frames[0]))
+    after = timed('downsampler, one frame',
+                  lambda: downsampler.resize(batch[0], out))
+    timed('downsampler, %d frames' % BATCH,
+          lambda: downsampler.resize(batch, batch_out))
+    print 'speedup per frame: %0.1fx' % (before / after)
+
+    # Timing doesn't depend on the palette or sidebar contents.
+    gray = np.random.uniform(0, 255, 256)
+    sidebars = dict((value, np.zeros((RESIZED_HEIGHT, 4))) for value in xrange(18))
+    preprocessor = FramePreprocessor(gray, sidebars)
+    screens = np.random.randint(0, 256, (BATCH, 210 * 160)).astype(np.uint8)
+    for num in (1, 4, BATCH):
+        out = preprocessor.allocate(num)
+        ms = timed('preprocess %d screens' % num,
+                   lambda: preprocessor.process(screens[:num], [0] * num, out))
+        print '%-28s %8.3f ms' % ('  per screen', ms / num)
+
+
+if __name__ == '__main__':
+    go()
@@ -5,6 +5,21 @@ DQN_ROOT                 = os.path.dirname(os.path.realpath(__file__))
 EPISODE_DIR_NAME         = 'episodes'
 INTEGRATE_HUMAN_FEEDBACK = 'INTEGRATE_HUMAN_FEEDBACK' in os.environ
 PLOT_LAYERS              = 'PLOT_LAYERS'              in os.environ
+RUN_LENGTH_ENCODING      = 'NO_RUN_LENGTH_ENCODING' not in os.environ  # Screens from ALE.
+ASYNC_FRAME_READ         = 'ASYNC_FRAME_READ'         in os.environ  # Read ahead frames on a thread, slower for now.
+PRIORITIZED_REPLAY       = 'PRIORITIZED_REPLAY'       in os.environ
+REPLAY_CLASS_QUOTAS      = os.environ.get('REPLAY_CLASS_QUOTAS')  # e.g. 0.25,0.25,0.5 for positive,negative,zero reward.
+REPLAY_DIR               = os.environ.get('REPLAY_DIR')  # Memory-mapped replay, reopened on resume.
+REPLAY_BYTES             = int(os.environ.get('REPLAY_BYTES', 7 * 2 ** 30))
+REPLAY_SHM_NAME          = os.environ.get('REPLAY_SHM_NAME')  # Replay shared by NUM_ACTORS processes.
+NUM_ACTORS               = int(os.environ.get('NUM_ACTORS', 1))
+ACTOR_ID                 = int(os.environ.get('ACTOR_ID', 0))
+ACTOR_ONLY               = 'ACTOR_ONLY'               in os.environ
+NUM_ENVS                 = int(os.environ.get('NUM_ENVS', 1))  # Emulators stepped together per actor.
+ALE_DIR                  = '/s/ale_0.4.4/ale_0_4/'
+ALE_FIFO_ROOT            = os.environ.get('ALE_FIFO_ROOT', '/tmp/ale_fifos')  # FIFO directory per emulator.
+FAKE_ALE                 = os.environ.get('FAKE_ALE')  # Run fake_ale.py with these extra flags instead of ALE.
+RECORD_EPISODES          = 'NO_RECORD_EPISODES' not in os.environ  # Upload episode frames for human feedback.
 FIREBASE_URL             = 'https://vivid-fire-9851.firebaseio.com'
 VOTE_URL                 = FIREBASE_URL + '/votes'
 BATCH_LIST_URL           = FIREBASE_URL + '/batches'
@@ -14,5 +29,5 @@ EXP_IMAGE_ACTION_INDEX   = 0
 EXP_ACTION_INDEX         = 1
 EXP_GAME_OVER_INDEX      = 2
 EXP_REWARD_INDEX         = 3
-EXP_SCREEN_HEX_INDEX     = 4
+EXP_SCREEN_INDEX         = 4
 MINIBATCH_SIZE           = 32
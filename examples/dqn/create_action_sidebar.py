@@ -17,7 +17,8 @@ class ActionSidebarImages(object):
         color        = 1,
         background   = 0,
         action_count = 18,
-        show         = False
+        show         = False,
+        dtype        = np.float32
     ):
         self.width           = width
         self.height          = height
@@ -25,6 +26,7 @@ class ActionSidebarImages(object):
         self.background      = background
         self.action_count    = action_count
         self.show            = show
+        self.dtype           = dtype  # Of the network input they're part of.
         self.random_nums     = self.initialize_random_nums()
         self._rand_num_index = 0
         self.images          = self.get_images()
@@ -53,7 +55,7 @@ class ActionSidebarImages(object):
                 all_images = np.concatenate((all_images, sep  ), axis=1)
                 all_images = np.concatenate((all_images, image), axis=1)
             print name
-            images[action.value] = image
+            images[action.value] = image.astype(self.dtype)
 
         if self.show:
             plt.imshow(all_images, cmap=plt.get_cmap('gray'))
@@ -67,10 +69,11 @@ class ActionSidebarImages(object):
         return self.sparsify(image, probability)
 
     def sparsify(self, image, probability):
-        for x in xrange(self.width):
-            for y in xrange(self.height):
-                if self.get_random_num() <= probability:
-                    image[y, x] = self.color
+        # Random numbers are laid out column by column, the order the
+        # original per-pixel loop consumed them in.
+        nums = self.get_random_nums(self.width * self.height)
+        nums = nums.reshape(self.width, self.height).T
+        image[nums <= probability] = self.color
         return image
 
     def get(self, action):
@@ -86,10 +89,10 @@ class ActionSidebarImages(object):
         num_base_pixels = num_base_images * pixels_per_image
         return rng.uniform(size=num_base_pixels)
 
-    def get_random_num(self):
-        ret = self.random_nums[self._rand_num_index]
-        self._rand_num_index += 1
-        return ret
+    def get_random_nums(self, num):
+        start = self._rand_num_index
+        self._rand_num_index += num
+        return self.random_nums[start:self._rand_num_index]
 
 
 if __name__ == '__main__':
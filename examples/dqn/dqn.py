@@ -2,8 +2,9 @@ import time
 import sys
 import utils
 from atari import Atari
+from vector_atari import VectorAtari
 import atari_actions as actions
-from episode_stats import EpisodeStats
+from episode_stats import EpisodeStats, EpisodeStat
 from dqn_solver import DqnSolver
 from constants import *
 
@@ -20,14 +21,24 @@ def go(solver_filename, start_iter):
     frame_dir_name = get_frame_dir_name(start_timestamp)
     os.makedirs(frame_dir_name)
     episode_count = 0
-    atari = Atari(frame_dir_name, episode_count, start_timestamp, show_game())
+    if NUM_ENVS > 1:
+        atari = VectorAtari(NUM_ENVS, frame_dir_name, start_timestamp,
+                            show_game())
+    else:
+        atari = Atari(frame_dir_name, episode_count, start_timestamp,
+                      show_game())
+    restore_replay(atari, solver, solver_filename)
     action = actions.MOVE_RIGHT_AND_FIRE
     episode_stats = EpisodeStats()
     dqn = DqnSolver(atari, net, solver, start_timestamp, start_iter)
+    if NUM_ENVS > 1:
+        return go_vector(atari, dqn, log_file_name)
     while dqn.iter < xrange(int(1E7)):  # 10 million training steps
 
         time1 = time.time()
-        experience = atari.experience(EXPERIENCE_WINDOW_SIZE, action)
+        # Preprocess straight into the net's input.
+        experience = atari.experience(EXPERIENCE_WINDOW_SIZE, action,
+                                      out=dqn.net_input.get_state())
         time2 = time.time()
         print '%s function took %0.3f ms' % \
               ('experience', (time2 - time1) * 1000.0)
@@ -49,11 +60,23 @@ def go(solver_filename, start_iter):
             action = actions.get_random_action()
 
         time1 = time.time()
-        episode_stat = dqn.learn_from_experience_replay()
+        if ACTOR_ONLY:
+            # Only feeds the shared replay memory of another learner process.
+            episode_stat = EpisodeStat(0.0, [], 0.0)
+        else:
+            episode_stat = dqn.learn_from_experience_replay()
         time2 = time.time()
         print '%s function took %0.3f ms' %\
               ('learn', (time2 - time1) * 1000.0)
 
+        time1 = time.time()
+        dqn.snapshot_replay()
+        time2 = time.time()
+        print '%s function took %0.3f ms' %\
+              ('snapshot-replay', (time2 - time1) * 1000.0)
+
+        dqn.sync_actor_weights()
+
         time1 = time.time()
         dqn.record_episode_stats(episode_stats, experience, q, action, exploit,
                                  episode_stat)
@@ -66,14 +89,74 @@ def go(solver_filename, start_iter):
             EpisodeStats.log_csv(episode_count, episode_stats, log_file_name)
             episode_count += 1
             episode_stats = EpisodeStats()
-            atari.stop()
             if 'TEST_AFTER_GAME' in os.environ:
+                atari.stop()
                 return
-            atari = Atari(frame_dir_name, episode_count, start_timestamp,
-                          show_game())
+            atari.reset(episode_count)
+        dqn.iter += 1
+        print 'dqn iteration: ', dqn.iter
+
+def go_vector(atari, dqn, log_file_name):
+    """Training loop stepping all emulators of a VectorAtari together, one
+    learning step per step of all of them."""
+    env_actions = [actions.MOVE_RIGHT_AND_FIRE] * len(atari)
+    env_stats = [EpisodeStats() for _ in xrange(len(atari))]
+    episode_count = len(atari)  # Emulators start on episodes 0 to N - 1.
+    while dqn.iter < 1E7:  # 10 million training steps
+
+        time1 = time.time()
+        experiences, observations = atari.experience(EXPERIENCE_WINDOW_SIZE,
+                                                     env_actions)
+        time2 = time.time()
+        print '%s function took %0.3f ms' % \
+              ('experience', (time2 - time1) * 1000.0)
+
+        time1 = time.time()
+        perceived = dqn.perceive_batch(observations)
+        time2 = time.time()
+        print '%s function took %0.3f ms' %\
+              ('perceive', (time2 - time1) * 1000.0)
+
+        time1 = time.time()
+        if ACTOR_ONLY:
+            episode_stat = EpisodeStat(0.0, [], 0.0)
+        else:
+            episode_stat = dqn.learn_from_experience_replay()
+        time2 = time.time()
+        print '%s function took %0.3f ms' %\
+              ('learn', (time2 - time1) * 1000.0)
+
+        dqn.snapshot_replay()
+        dqn.sync_actor_weights()
+
+        for i, (experience, (q, action)) in \
+                enumerate(zip(experiences, perceived)):
+            exploit = dqn.should_exploit()
+            if not exploit:
+                action = actions.get_random_action()
+            env_actions[i] = action
+            dqn.record_episode_stats(env_stats[i], experience, q, action,
+                                     exploit, episode_stat)
+            if atari[i].game_over:
+                EpisodeStats.log_csv(atari[i].episode_num, env_stats[i],
+                                     log_file_name)
+                env_stats[i] = EpisodeStats()
+                atari[i].reset(episode_count)
+                episode_count += 1
         dqn.iter += 1
         print 'dqn iteration: ', dqn.iter
 
+
+def restore_replay(atari, solver, solver_filename):
+    """When resuming from a solver snapshot, reload the replay memory
+    snapshot written next to it."""
+    replay_snapshot_dir = utils.get_replay_snapshot_dir(solver)
+    # An empty memory is falsy, so test for None.
+    if solver_filename and atari.replay_memory is not None and \
+            os.path.exists(replay_snapshot_dir):
+        atari.replay_memory.restore(replay_snapshot_dir)
+
+
 def show_game():
     if os.path.isfile(DQN_ROOT + '/show-game'):
         return True
@@ -97,12 +180,15 @@ def get_episode_dir():
     return '%s/data/%s' % (DQN_ROOT, EPISODE_DIR_NAME)
 
 
+# Actors sharing a host may start within the same second.
 def get_episode_log_filename(start_timestamp):
-    return '%s/episode_log_%d.csv' % (get_episode_dir(), start_timestamp)
+    return '%s/episode_log_%d_actor_%d.csv' % (get_episode_dir(),
+                                               start_timestamp, ACTOR_ID)
 
 
 def get_frame_dir_name(start_timestamp):
-    return '%s/frames_%d'     % (get_episode_dir(), start_timestamp)
+    return '%s/frames_%d_actor_%d' % (get_episode_dir(), start_timestamp,
+                                      ACTOR_ID)
 
 if __name__ == '__main__':
     _solver_filename = None
@@ -10,9 +10,12 @@ import numpy as np
 import os
 import sys
 import atari_actions as actions
-from utils import vis_square, get_image_path, l1_norm
-from constants import LAYER_NAMES, INTEGRATE_HUMAN_FEEDBACK, PLOT_LAYERS, MINIBATCH_SIZE
+from utils import vis_square, get_image_path, l1_norm, get_replay_snapshot_dir, \
+    get_shared_net, get_target_net, load_trained_layers
+from constants import LAYER_NAMES, INTEGRATE_HUMAN_FEEDBACK, PLOT_LAYERS, MINIBATCH_SIZE, \
+    ACTOR_ONLY, NUM_ENVS
 from episode_stats import EpisodeStat
+from net_input import NetInput
 
 
 # Epsilon annealed linearly from 1 to 0.1 over the first million frames,
@@ -26,39 +29,55 @@ LEARNING_RATE = 0.6
 GAME_OVER_STEPS = 32  # Takes 13 steps for player to die in space invaders. Need to generalize this.
 GET_IMPROVEMENT = False
 MAX_MINIBATCH_REWARD = 2.0
+TARGET_NET_SYNC_INTERVAL = 1000  # Updates between target network syncs.
+ACTOR_WEIGHTS_INTERVAL = 1000  # Steps between learner to actor weight syncs.
 
 
 class DqnSolver(object):
     def __init__(self, atari, net, solver, start_timestamp, start_iter):
         self.atari           = atari
         self.net             = net
+        self.train_input     = NetInput(net, MINIBATCH_SIZE)
+        self.loss_targets    = np.zeros(MINIBATCH_SIZE, dtype=np.float32)
+        self.loss_weights    = np.zeros(MINIBATCH_SIZE, dtype=np.float32)
+        self.act_net         = get_shared_net(solver, 'act', 1)
+        self.net_input       = NetInput(self.act_net)
+        # The observations of all emulators, in one forward.
+        self.batch_act_net   = get_shared_net(solver, 'batch_act', NUM_ENVS)
+        self.batch_act_input = NetInput(self.batch_act_net, NUM_ENVS)
+        # Replay minibatch states for the sanity checks.
+        self.eval_net        = get_shared_net(solver, 'eval',
+                                              2 * MINIBATCH_SIZE)
+        self.eval_input      = NetInput(self.eval_net, 2 * MINIBATCH_SIZE)
+        self.target_net      = get_target_net(solver)
+        self.target_input    = NetInput(self.target_net, MINIBATCH_SIZE)
         self.solver          = solver
         self.iter            = start_iter
         self._forced_exploit = False
         self.start_timestamp = start_timestamp
+        self.replay_snapshot_count = self.get_solver_snapshot_count()
 
     def learn_from_experience_replay(self):
         time1 = time.time()
-        transition_minibatch = \
-            self.atari.get_random_transition_pairs(num=MINIBATCH_SIZE)
-        print 'len of pairs ', len(transition_minibatch)
+        batch = self.atari.get_random_transition_batch(num=MINIBATCH_SIZE)
+        print 'len of batch ', len(batch) if batch else 0
         time2 = time.time()
         print '%s function took %0.3f ms' %\
               ('get-minibatch', (time2 - time1) * 1000.0)
 
-        if transition_minibatch:
+        if batch:
+            rewards = self.get_rewards(batch)
             if INTEGRATE_HUMAN_FEEDBACK:
                 time1 = time.time()
-                transition_minibatch = self.normalize_rewards(transition_minibatch)
+                rewards = self.normalize_rewards(rewards)
                 time2 = time.time()
                 print '%s function took %0.3f ms' %\
                       ('normalize-reward', (time2 - time1) * 1000.0)
             else:
-                transition_minibatch = \
-                    self.extend_game_over_into_past(transition_minibatch)
+                rewards = self.extend_game_over_into_past(batch, rewards)
 
             time1 = time.time()
-            ret = self.process_minibatch(transition_minibatch)
+            ret = self.process_minibatch(batch, rewards)
             time2 = time.time()
             print '%s function took %0.3f ms' %\
                   ('process-minibatch', (time2 - time1) * 1000.0)
@@ -66,148 +85,123 @@ class DqnSolver(object):
         else:
             return EpisodeStat(0.0, [], 0.0)
 
-    def extend_game_over_into_past(self, transition_minibatch):
-        ret = []  # Copy so we don't corrupt future runs.
-        tm = transition_minibatch
-        atari = self.atari
+    def get_rewards(self, batch):
+        """Vectorized Atari.get_reward_from_experience of each next state."""
+        ret = np.sign(batch.scores).astype(np.float64)
+        if INTEGRATE_HUMAN_FEEDBACK:
+            # Game over is replaced by more accurate crowdsourced-detected
+            # deaths.
+            ret[batch.game_overs[:, 1]] = 0.0
+        else:
+            ret[batch.game_overs[:, 1]] = -1.0
+        return ret
 
-        for i, transition in enumerate(tm):
-            if self.should_propagate(i, transition):
-                print 'extending game-over into past'
-                start = max(0, i - GAME_OVER_STEPS)
-                reward = - MAX_MINIBATCH_REWARD / float(GAME_OVER_STEPS)
-                for j, (exp1, exp2) in enumerate(tm[start:i + 1]):
-                    ret.append((
-                        atari.substitute_reward_in_experience(exp1, reward),
-                        atari.substitute_reward_in_experience(exp2, reward)
-                    ))
-                # Assume max of one game over per minibatch
-                return tm[:start] + ret + tm[i + 1:]
-        return transition_minibatch
-
-    def should_propagate(self, i, transition):
-        return i >= (GAME_OVER_STEPS - 1) and (
-            os.environ.has_key('TEST_NEGATIVE_REWARD_DECAY')  # Just for quickly sanity testing this block.
-            or
-            self.atari.get_game_over_from_experience(transition[0])
-            or
-            self.atari.get_game_over_from_experience(transition[1])
-        )
+    def extend_game_over_into_past(self, batch, rewards):
+        """Spread a negative reward over the GAME_OVER_STEPS steps leading up
+        to each game over, and the game over itself."""
+        ret = np.copy(rewards)
+        dying = (batch.steps_to_game_over >= 0) & \
+                (batch.steps_to_game_over <= GAME_OVER_STEPS)
+        if 'TEST_NEGATIVE_REWARD_DECAY' in os.environ:
+            dying[:] = True  # Just for quickly sanity testing this.
+        if dying.any():
+            print 'extending game-over into past'
+            # - MAX_MINIBATCH_REWARD / GAME_OVER_STEPS per frame, clipped to
+            # its sign like any other reward.
+            ret[dying] = -1.0
+        return ret
 
-    def forward_batch(self, transition_minibatch):
-        q_gradients = [0.0] * len(actions.ALL)
-        q_sum = 0
-        q_max_sum = 0
-        q_olds = []
-        for transition in transition_minibatch:
-            q_max, q_values, action_index, reward = \
-                self.get_update_variables(transition)
-            q_sum += sum(q_values)
-            q_max_sum += q_max
-            q_olds.append(q_values)
-            q_old = float(q_values[action_index])
-            q_new = LEARNING_RATE * (reward + GAMMA * q_max)
-            q_gradients[action_index] += q_old - q_new
-        return q_gradients, q_max_sum, q_sum, q_olds
-
-    def normalize_rewards(self, transition_minibatch):
+    def forward_batch(self, batch, rewards):
+        """Q(s), TD targets and TD errors of every transition in the batch."""
+        q_values = self.get_q_values_batch(batch.states)
+        targets = self.get_targets(batch, rewards)
+        td_errors = q_values[np.arange(len(batch)), batch.actions] - targets
+        return q_values, targets, td_errors
+
+    def get_targets(self, batch, rewards):
+        """TD targets from the target network's max Q of each next state."""
+        q_max = self.get_target_q_max(batch.next_states)
+        # state(s) -> action(s') -> reward(s')
+        return LEARNING_RATE * (rewards + GAMMA * q_max)
+
+    def sync_target_net(self):
+        """Every TARGET_NET_SYNC_INTERVAL updates, copy the live parameters
+        into the target network."""
+        if self.solver.iter % TARGET_NET_SYNC_INTERVAL == 0:
+            print 'syncing target network'
+            self.target_net.copy_trained_layers_from(self.net)
+
+    def normalize_rewards(self, rewards):
         """
-        :param transition_minibatch:
-        :return: copy of transition_minibatch with rewards limited to a max
-        total reward across the minibatch. Only dominant reward across minibatch
-        (positive or negative) will be used.
+        :param rewards: reward of each transition in the minibatch
+        :return: rewards limited to a max total reward across the minibatch.
+        Only dominant reward across minibatch (positive or negative) will be
+        used.
         """
-
-        ret = []  # Copy so we don't corrupt future runs.
-        atari = self.atari
         max_batch_reward = 0.5
-        death_in_minibatch, total_reward = self.get_reward_aggregates(
-            transition_minibatch)
-
-        for pair in transition_minibatch:
-            reward = self.get_reward_from_experience_pair(pair)
-            new_reward = 0.0
-            if death_in_minibatch and reward > 0:
-                # If death in minibatch, don't count positive rewards.
-                new_reward = 0.0
-            elif total_reward != 0 and reward != 0:
-                new_reward = max_batch_reward * float(reward) / total_reward
-            exp1, exp2 = pair
-            ret.append([
-                atari.substitute_reward_in_experience(exp1, new_reward),
-                atari.substitute_reward_in_experience(exp2, new_reward)
-            ])
-            print 'limited reward', new_reward,  \
-                  'old reward',     reward,      \
-                  'total reward',   total_reward
+        death_in_minibatch, total_reward = self.get_reward_aggregates(rewards)
+        if total_reward != 0:
+            ret = max_batch_reward * rewards / total_reward
+        else:
+            ret = np.zeros_like(rewards)
+        if death_in_minibatch:
+            # If death in minibatch, don't count positive rewards.
+            ret[rewards > 0] = 0.0
+        # Limited rewards are clipped to their sign like any other reward.
+        ret = np.sign(ret)
+        print 'limited rewards', ret[rewards != 0], \
+              'old rewards',     rewards[rewards != 0], \
+              'total reward',    total_reward
         return ret
 
-    def get_reward_aggregates(self, transition_minibatch):
-        total_pos_reward = 0.0
-        total_neg_reward = 0.0
-        death_in_minibatch = False
-        for pair in transition_minibatch:
-            reward = self.get_reward_from_experience_pair(pair)
-            if reward < 0:
-                death_in_minibatch = True
-                total_neg_reward += reward
-            else:
-                total_pos_reward += reward
+    def get_reward_aggregates(self, rewards):
+        negative = rewards < 0
+        death_in_minibatch = bool(negative.any())
         if death_in_minibatch:
-            total_reward = total_neg_reward * -1
+            total_reward = rewards[negative].sum() * -1
         else:
-            total_reward = total_pos_reward
+            total_reward = rewards.sum()
         return death_in_minibatch, total_reward
 
-    def forward_check(self, q_olds, transition_minibatch):
+    def forward_check(self, q_olds, batch, rewards):
         """Sanity check that we are moving in the right direction"""
         # TODO: Proper finite-difference gradient check
-        improvement = 0
-        for i, transition in enumerate(transition_minibatch):
-            q_max, q_values, action_index, reward = \
-                self.get_update_variables(transition)
-            q_values_old = q_olds[i]
-            for j, q_old in enumerate(q_values_old):
-                q_new = LEARNING_RATE * (reward + GAMMA * q_max)
-                # assert(q_old < 1)
-                improvement += (q_new - q_old)
-        return improvement
-
-    def improvement_check_one(self, transition_minibatch):
-        for transition in transition_minibatch:
-            reward, _ = self.atari.get_reward_from_experience(transition[1])
-            if reward != 0:
-                q_gradients = [0.0] * len(actions.ALL)
-                q_max, q_values, action_index, reward = \
-                    self.get_update_variables(transition)
-                q_old = float(q_values[action_index])  # copy
-                # TODO(Sync with Caffe and momentum)
-                q_new = LEARNING_RATE * (reward + GAMMA * q_max)
-                q_gradients[action_index] += q_old - q_new
-                self.set_gradients_on_caffe_net(q_gradients)
-                self.solver.online_update()  # backprop
-                _, q_values_updated, _, _ = self.get_update_variables(transition)
-                improvement = q_values_updated[action_index] - q_old
-                if improvement > 0:
-                    pass
-                else:
-                    raise Exception('backprop failed sanity check. is momentum on?')
-
-    def process_minibatch(self, transition_batch):
-        # self.improvement_check_one(transition_batch)
-        q_gradients, q_max_sum_orig, q_sum_orig, q_olds = \
-            self.forward_batch(transition_batch)
-        q_gradients = 1.0 / float(len(transition_batch)) * np.array(q_gradients)  # avg
-        # TODO: Figure out if loss (not just gradient) needs to be calculated.
+        _, targets, _ = self.forward_batch(batch, rewards)
+        # assert(q_old < 1)
+        return float((targets[:, np.newaxis] - q_olds).sum())
+
+    def improvement_check_one(self, batch, rewards):
+        """Sanity check that one update moves the Q-values of rewarding
+        transitions towards their targets."""
+        rewarding = rewards != 0
+        if not rewarding.any():
+            return
+        _, targets, td_errors = self.forward_batch(batch, rewards)
+        # TODO(Sync with Caffe and momentum)
+        self.train(batch, targets)
+        _, _, td_errors_updated = self.forward_batch(batch, rewards)
+        if np.abs(td_errors_updated[rewarding]).sum() >= \
+                np.abs(td_errors[rewarding]).sum():
+            raise Exception('backprop failed sanity check. is momentum on?')
+
+    def process_minibatch(self, batch, rewards):
+        # self.improvement_check_one(batch, rewards)
+        targets = self.get_targets(batch, rewards)
         # TODO: Lower learning rate if q gradients are too high to mitigate exploding gradients while safely allowing higher learning rates.
-        self.set_gradients_on_caffe_net(q_gradients)
         layers_orig = self.get_layer_state()
-        self.solver.online_update()  # backprop
+        q_olds, loss = self.train(batch, targets)
+        td_errors = q_olds[np.arange(len(batch)), batch.actions] - targets
+        if not INTEGRATE_HUMAN_FEEDBACK:
+            self.atari.update_priorities(batch, td_errors)
+        self.sync_target_net()
         layers_after = self.get_layer_state()
+        # Same as the old batch averaged gradient of each action.
+        q_gradients = self.net.blobs['fc2'].diff.sum(axis=0).flat
+        print 'q-loss', loss
         # TODO: Remove or reduce frequency of distance calculation to speed up training.
         layer_distances = self.get_layer_distances(layers_orig, layers_after)
         if GET_IMPROVEMENT:
-            improvement = self.forward_check(q_olds, transition_batch)
+            improvement = self.forward_check(q_olds, batch, rewards)
         else:
             improvement = 0.0
         self.save_graphs()
@@ -248,12 +242,64 @@ class DqnSolver(object):
         print ''
         return ret
 
-    def set_gradients_on_caffe_net(self, q_gradients):
-        # Set mutable_cpu_diff of fc2 data to:
-        net = self.net
-        for i in xrange(len(actions.ALL)):
-            # TODO: May need to reverse this gradient.
-            net.blobs['fc2'].diff[0][i] = np.reshape(q_gradients[i], (1, 1, 1))
+    def train(self, batch, targets):
+        """Forward, backprop and update on batch in one solver call.
+        Returns the batch's Q-values from before the update and the
+        Q-loss."""
+        self.set_loss_inputs(batch, targets)
+        q_values, loss = self.solver.online_train_step(
+            self.train_input.data, self.train_input.labels,
+            self.loss_targets, self.loss_weights)
+        return q_values[:len(batch)], loss
+
+    def set_loss_inputs(self, batch, targets):
+        """Fill the training input arrays with the batch's states, actions,
+        targets and importance sampling weights. Rows past the end of a
+        short batch get zero weight, which the Q loss leaves out of its
+        average."""
+        num = len(batch)
+        if num > self.train_input.batch_size:
+            raise Exception('batch of %d transitions exceeds the training '
+                            'net batch of %d' %
+                            (num, self.train_input.batch_size))
+        self.train_input.set_states(batch.states)
+        self.train_input.labels[:num, 0, 0, 0] = batch.actions
+        self.loss_targets[:num] = targets
+        self.loss_weights[num:] = 0.0
+        if batch.weights is None:
+            self.loss_weights[:num] = 1.0
+        else:
+            self.loss_weights[:num] = batch.weights
+
+    def sync_actor_weights(self):
+        """With replay shared between processes, the learner publishes its
+        parameters every ACTOR_WEIGHTS_INTERVAL steps and ACTOR_ONLY
+        processes load the latest ones, so actors follow the learned
+        policy."""
+        path = getattr(self.atari.replay_memory, 'weights_path', None)
+        if path is None or self.iter % ACTOR_WEIGHTS_INTERVAL:
+            return
+        if not ACTOR_ONLY:
+            # Readers only ever see a complete file.
+            self.net.save(path + '.tmp')
+            os.rename(path + '.tmp', path)
+        elif os.path.exists(path):
+            load_trained_layers(self.solver, path)
+            print 'loaded learner weights from', path
+
+    def get_solver_snapshot_count(self):
+        interval = self.solver.snapshot_interval
+        return self.solver.iter // interval if interval else 0
+
+    def snapshot_replay(self):
+        """Write changed replay segments whenever the solver has written a
+        new snapshot."""
+        count = self.get_solver_snapshot_count()
+        if count > self.replay_snapshot_count and \
+                self.atari.replay_memory is not None:
+            self.atari.replay_memory.snapshot(
+                get_replay_snapshot_dir(self.solver))
+        self.replay_snapshot_count = count
 
     def should_exploit(self):
         i = self.iter
@@ -281,6 +327,17 @@ class DqnSolver(object):
         action_index = self.get_random_q_max_index(q_values)
         return q_values[action_index], actions.ALL.values()[action_index]
 
+    def perceive_batch(self, states):
+        """(q, action) with the highest Q for each of a batch of states,
+        e.g. one per emulator."""
+        ret = []
+        for q_values in self.forward_states(self.batch_act_net,
+                                            self.batch_act_input, states):
+            action_index = self.get_random_q_max_index(q_values)
+            ret.append((float(q_values[action_index]),
+                        actions.ALL.values()[action_index]))
+        return ret
+
     def record_episode_stats(self, episode_stats, experience, q, action,
                              exploit, episode_stat):
         reward, score = self.atari.get_reward_from_experience(experience)
@@ -296,29 +353,13 @@ class DqnSolver(object):
         random_max_index = index_values[0][0]
         return random_max_index
 
-    def get_update_variables(self, experience_pair):
-        atari = self.atari
-        exp1 = experience_pair[0]
-        exp2 = experience_pair[1]
-        exp1_state = atari.get_state_from_experience(exp1)
-        exp2_state = atari.get_state_from_experience(exp2)
-        exp2_action = atari.get_action_from_experience(exp2)
-        q_values_one = self.get_q_values(exp1_state)
-        # print 'q values one', q_values_one
-        # q_old_action = q_values_one[exp2_action.index]
-        # print 'old action', q_old_action
-        q_values_two = self.get_q_values(exp2_state)
-        # print 'q_values_two', q_values_two
-        q_max_index = self.get_random_q_max_index(q_values_two)
-        q_max = q_values_two[q_max_index]
-        reward = self.get_reward_from_experience_pair(experience_pair)
-        # state(exp1) -> action(exp2) -> reward(exp2)
-        return q_max, q_values_one, exp2_action.index, reward
-
-    def get_reward_from_experience_pair(self, pair):
-        _, exp2 = pair
-        reward, _ = self.atari.get_reward_from_experience(exp2)
-        return reward
+    def get_q_max(self, q_values):
+        """Highest Q of each row of q_values. Unlike for acting, which of
+        several tied actions has it makes no difference."""
+        ret = np.nanmax(q_values, axis=1)
+        if np.isnan(ret).any():
+            raise Exception('Exploding activity values?')
+        return ret
 
     def plot_layers(self):
         net = self.net
@@ -358,20 +399,38 @@ class DqnSolver(object):
         """ fprop the state through the net
         get the output neuron with the highest activation"""
 
-        # Dummy values. Just humoring set_input_arrays for now.
-        labels = np.array([3.0], dtype=np.float32)
-
-        # [(1, 4, 84, 84)] image stack array (4, exp).
-        # Treating frames as channels.
-        self.net.set_input_arrays(np.array([state], dtype=np.float32), labels)
-
-        # TODO: Create Q-loss layer in C++ if this is slow.
-        self.solver.online_forward()
+        # (4, 84, 84) image stack (4, exp) into the bound (1, 4, 84, 84)
+        # input of the acting net. Treating frames as channels.
+        self.net_input.set_state(state)
+        self.act_net.forward()
 
         # Get top data.
-        return list(self.net.blobs['fc2'].data.flat)
+        return list(self.act_net.blobs['fc2'].data.flat)
         # feat = net.blobs['fc2'].data[4]
         # plt.subplot(2, 1, 1)
         # plt.plot(feat.flat)
         # plt.subplot(2, 1, 2)
         # _ = plt.hist(feat.flat[feat.flat > 0], bins=100)
+
+    def get_q_values_batch(self, states):
+        """(len(states), num actions) Q-values of a batch of states, forwarded
+        through the eval net a full eval batch at a time."""
+        return self.forward_states(self.eval_net, self.eval_input, states)
+
+    def get_target_q_max(self, states):
+        """Target network max Q of each of a batch of states."""
+        return self.get_q_max(self.forward_states(
+            self.target_net, self.target_input, states))
+
+    def forward_states(self, net, net_input, states):
+        """Q-values of states through net, whose input is bound to
+        net_input, one full batch at a time."""
+        ret = np.empty((len(states), len(actions.ALL)), dtype=np.float32)
+        for start in xrange(0, len(states), net_input.batch_size):
+            chunk = states[start:start + net_input.batch_size]
+            net_input.set_states(chunk)
+            net.forward()
+            # Rows past the chunk are stale and ignored.
+            ret[start:start + len(chunk)] = net.blobs['fc2'].data[
+                :len(chunk)].reshape((len(chunk), len(actions.ALL)))
+        return ret
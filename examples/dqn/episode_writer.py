@@ -0,0 +1,51 @@
+from threading import Thread
+from Queue import Queue
+import traceback
+
+# Episodes waiting to be written before the actor blocks on the next one.
+MAX_QUEUE_SIZE = 4
+
+
+class EpisodeWriter(object):
+    """
+    Writes recorded episodes on a single daemon thread for the whole
+    process, however many emulators record.
+
+    The actor only hands over each episode's recording, whose screens are
+    still uint8 palette indices. Preprocessing, hex and JSON encoding and
+    the upload all happen on the worker. The queue is bounded, so an actor
+    finishing episodes faster than they are written blocks in put instead
+    of piling up threads and recordings.
+    """
+    def __init__(self, max_queue_size=MAX_QUEUE_SIZE):
+        self.queue = Queue(maxsize=max_queue_size)
+        self.thread = Thread(target=self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            write, args = item
+            try:
+                write(*args)
+            except:
+                # Background thread exceptions don't bubble up.
+                print 'ERROR: failed to write episode'
+                traceback.print_exc()
+            self.queue.task_done()
+
+    def put(self, write, *args):
+        """Call write(*args) on the worker, e.g. Atari.log_frames."""
+        self.queue.put((write, args))
+
+    def join(self):
+        """Wait until every episode put so far is written."""
+        self.queue.join()
+
+    def stop(self):
+        """Write the remaining episodes and end the thread, e.g. at exit."""
+        self.queue.put(None)
+        self.thread.join()
@@ -8,7 +8,9 @@ import time
 import snappy
 from constants import *
 import atari_actions
+import utils
 from constants import MINIBATCH_SIZE
+from replay import TransitionBatch
 
 MAX_QUEUE_SIZE = 2
 NUM_PRODUCERS  = 2
@@ -27,7 +29,7 @@ def producer(q):
                 for batch in chunks(pairs, MINIBATCH_SIZE):
                     # time.sleep(diff)
                     time1 = time.time()
-                    q.put(batch)  # blocks when q is full
+                    q.put(TransitionBatch.from_pairs(batch))  # blocks when q is full
                     time2 = time.time()
                     diff = time2 - time1
                     print '%s function took %0.3f ms' %\
@@ -79,7 +81,7 @@ def deserialize(frames):
         r[EXP_ACTION_INDEX]       = atari_actions.ALL[exp['action']]
         r[EXP_GAME_OVER_INDEX]    =                   exp['game_over']
         r[EXP_REWARD_INDEX]       =                   exp['reward']
-        r[EXP_SCREEN_HEX_INDEX]   =                   exp['screen_hex']
+        r[EXP_SCREEN_INDEX]       = utils.screen_hex_to_indices(exp['screen_hex'])
         ret.append(r)
     return ret
 
@@ -0,0 +1,161 @@
+"""
+Deterministic stand-in for ALE's fifo_named game controller, for measuring
+the actor/learner loop without the emulator or ROM.
+
+Speaks the same protocol over ale_fifo_out and ale_fifo_in in the working
+directory: a width-height handshake, then one screen_hex:episode: line per
+frame, answered by one player_a,player_b action line. Action 40 (RESET)
+starts a new episode.
+
+Screens either cycle through a file of recorded screen hex lines (one per
+line, e.g. screen_hex) or are generated: rows of invaders sweeping back
+and forth over a black background and a player cannon moved by the agent's
+actions. Rewards and game overs are drawn from a RandomState seeded with
+-seed, so the same seed and actions give the same frames.
+
+Accepts ALE's own flags, so Atari.launch can run it in ALE's place with
+FAKE_ALE set.
+"""
+import argparse
+import binascii
+import time
+
+import numpy as np
+
+WIDTH  = 160
+HEIGHT = 210
+RESET  = 40
+
+BACKGROUND = 0x00
+INVADER    = 0x1E
+CANNON     = 0xC4
+INVADER_ROWS = range(40, 120, 16)
+INVADER_COLUMNS = range(8, 104, 16)
+CANNON_ROW = 185
+CANNON_SPEED = 2
+RIGHT_ACTIONS = (3, 6, 8, 11, 14, 16)
+LEFT_ACTIONS  = (4, 7, 9, 12, 15, 17)
+FIRE_ACTIONS  = (1,) + tuple(range(10, 18))
+HIT_PROBABILITY = 0.05
+HIT_REWARDS = (5, 10, 15, 20, 25, 30)
+
+
+class FakeAle(object):
+    def __init__(self, seed=0, episode_frames=2000, screens=None):
+        self.rng = np.random.RandomState(seed)
+        self.episode_frames = episode_frames
+        self.screens = screens
+        self.reset()
+
+    def reset(self):
+        self.frame = 0
+        self.cannon = WIDTH // 2
+        # Episodes last between half and one and a half times
+        # episode_frames, like games lost sooner or later.
+        self.length = int(self.episode_frames * self.rng.uniform(0.5, 1.5))
+        self.terminal = False
+
+    def act(self, action):
+        """One emulator frame. Returns the reward."""
+        if self.terminal:
+            return 0
+        if action in RIGHT_ACTIONS:
+            self.cannon = min(self.cannon + CANNON_SPEED, WIDTH - 8)
+        elif action in LEFT_ACTIONS:
+            self.cannon = max(self.cannon - CANNON_SPEED, 0)
+        ret = 0
+        if action in FIRE_ACTIONS and self.rng.uniform() < HIT_PROBABILITY:
+            ret = HIT_REWARDS[self.rng.randint(len(HIT_REWARDS))]
+        self.frame += 1
+        self.terminal = self.frame >= self.length
+        return ret
+
+    def get_screen(self):
+        """(HEIGHT * WIDTH,) uint8 palette indices of the current frame."""
+        if self.screens is not None:
+            return self.screens[self.frame % len(self.screens)]
+        ret = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+        ret[:] = BACKGROUND
+        # Sweep 40 pixels right and back every 160 frames.
+        offset = abs(self.frame % 160 - 80) // 2
+        for row in INVADER_ROWS:
+            for column in INVADER_COLUMNS:
+                ret[row:row + 8, offset + column:offset + column + 10] = INVADER
+        ret[CANNON_ROW:CANNON_ROW + 8, self.cannon:self.cannon + 8] = CANNON
+        return ret.ravel()
+
+
+def encode_screen(screen, run_length_encoding):
+    """Screen hex the way ALE sends it, run length encoded if asked: two hex
+    digits of palette index and two of run length (at most 255) per run."""
+    if not run_length_encoding:
+        return binascii.hexlify(screen.tostring()).upper()
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(screen)) + 1))
+    lengths = np.diff(np.concatenate((starts, [len(screen)])))
+    colors = screen[starts]
+    # Split runs longer than 255.
+    pieces = (lengths + 254) // 255
+    colors = np.repeat(colors, pieces)
+    run_lengths = np.full(len(colors), 255, dtype=np.int64)
+    last = np.cumsum(pieces) - 1
+    run_lengths[last] = lengths - 255 * (pieces - 1)
+    runs = np.column_stack((colors, run_lengths)).astype(np.uint8)
+    return binascii.hexlify(runs.tostring()).upper()
+
+
+def load_screens(filename):
+    with open(filename) as screens_file:
+        return [np.fromstring(binascii.unhexlify(line.strip()), dtype=np.uint8)
+                for line in screens_file if line.strip()]
+
+
+def serve(ale, run_length_encoding, frame_skip, fps):
+    fout = open('ale_fifo_out', 'w')
+    fin = open('ale_fifo_in', 'r')
+    fout.write('%d-%d\n' % (WIDTH, HEIGHT))
+    fout.flush()
+    fin.readline()  # Which data to send; always screen and episode here.
+    frame_time = 1.0 / fps if fps else 0
+    reward = 0
+    while True:
+        start = time.time()
+        fout.write('%s:%d,%d:\n' % (
+            encode_screen(ale.get_screen(), run_length_encoding),
+            ale.terminal, reward))
+        fout.flush()
+        line = fin.readline()
+        if not line:
+            return  # Agent went away.
+        action = int(line.split(',')[0])
+        if action == RESET:
+            ale.reset()
+            reward = 0
+        else:
+            reward = sum([ale.act(action) for _ in xrange(frame_skip)])
+        remaining = frame_time - (time.time() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-run_length_encoding', default='false')
+    parser.add_argument('-display_screen',      default='false')  # Ignored.
+    parser.add_argument('-game_controller',     default='fifo_named')
+    parser.add_argument('-frame_skip',          type=int, default=1)
+    parser.add_argument('-seed',                type=int, default=0)
+    parser.add_argument('-episode_frames',      type=int, default=2000,
+                        help='mean frames per episode')
+    parser.add_argument('-fps',                 type=float, default=0,
+                        help='max frames sent per second, 0 for no limit')
+    parser.add_argument('-screens',             default=None,
+                        help='file of recorded screen hex lines to cycle')
+    parser.add_argument('rom', nargs='?')  # Ignored.
+    args = parser.parse_args()
+    screens = load_screens(args.screens) if args.screens else None
+    ale = FakeAle(args.seed, args.episode_frames, screens)
+    serve(ale, args.run_length_encoding == 'true', args.frame_skip, args.fps)
+
+
+if __name__ == '__main__':
+    main()
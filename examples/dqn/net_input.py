@@ -0,0 +1,42 @@
+import numpy as np
+
+from replay import FRAMES_PER_STEP, FRAME_HEIGHT, FRAME_WIDTH
+
+
+class NetInput(object):
+    """
+    Persistent float32 data and label arrays, bound to a net's
+    MemoryDataLayer once.
+
+    MemoryDataLayer points its top blob straight at the bound memory on
+    every forward, so putting a state in front of the net is just writing
+    its frames into data. Nothing is converted or allocated per forward.
+    The preprocessor can write a new frame-skip window directly into a
+    state's frame slots (see get_state), in which case there is nothing left
+    to copy at all.
+    """
+    def __init__(self, net, batch_size=1):
+        self.batch_size = batch_size
+        self.data = np.zeros(
+            (batch_size, FRAMES_PER_STEP, FRAME_HEIGHT, FRAME_WIDTH),
+            dtype=np.float32)
+        # The Q-loss layer's action indices. Dummy values for nets without
+        # one, just humoring set_input_arrays.
+        self.labels = np.zeros((batch_size, 1, 1, 1), dtype=np.float32)
+        net.set_input_arrays(self.data, self.labels)
+
+    def get_state(self, index=0):
+        """(FRAMES_PER_STEP, 84, 84) view of one state's frame slots."""
+        return self.data[index]
+
+    def set_state(self, frames, index=0):
+        """Copy frames into a state's slots, skipping any frame that was
+        already written in place."""
+        for slot, frame in zip(self.data[index], frames):
+            if not np.may_share_memory(slot, frame):
+                slot[...] = frame
+
+    def set_states(self, states, start=0):
+        """Copy a (num, FRAMES_PER_STEP, 84, 84) batch into the slots of
+        states start to start + num in one go."""
+        self.data[start:start + len(states)] = states
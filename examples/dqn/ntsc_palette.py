@@ -1,3 +1,8 @@
+import numpy as np
+
+from utils import rgb2gray
+
+
 class NTSCPalette(object):
     def __init__(self):
         self.colors = []
@@ -48,6 +53,14 @@ class NTSCPalette(object):
             # print str(r) + ',', str(g) + ',', str(b) + ','
             self.colors.append((r, g, b))
 
+        # colors as a (256, 3) lookup table, so a whole screen of palette
+        # indices converts to RGB with one gather.
+        self.rgb = np.array(self.colors, dtype=np.uint8)
+
+        # Gray level of each palette index, computed with rgb2gray itself so
+        # frames come out exactly as when converting from RGB.
+        self.gray = rgb2gray(self.rgb)
+
 
 if __name__ == '__main__':
     x = NTSCPalette()
@@ -0,0 +1,112 @@
+import numpy as np
+
+# ALE screen and the DQN paper's downsampled frame, not counting the action
+# sidebar.
+SCREEN_HEIGHT = 210
+SCREEN_WIDTH  = 160
+RESIZED_HEIGHT = 84
+RESIZED_WIDTH  = 80
+
+
+class Downsampler(object):
+    """
+    Bilinear resize for one fixed input and output geometry.
+
+    Equivalent to caffe.io.resize_image_binary (skimage.transform.resize with
+    order 1), but the sampling coordinates are worked out once. Each output
+    row is a weighted sum of two input rows and each output column of two
+    input columns, so the resize is two passes of row and column gathers
+    with precomputed taps, i.e. a sparse separable operator. A batch of
+    frames goes through the same two passes at once.
+    """
+    def __init__(self, in_shape=(SCREEN_HEIGHT, SCREEN_WIDTH),
+                 out_shape=(RESIZED_HEIGHT, RESIZED_WIDTH), dtype=np.float32):
+        self.in_shape = in_shape
+        self.out_shape = out_shape
+        self.dtype = dtype
+        self.row_taps = self.get_taps(in_shape[0], out_shape[0], dtype)
+        self.col_taps = self.get_taps(in_shape[1], out_shape[1], dtype)
+        # The row weights broadcast over columns.
+        self.row_taps = [(index, weight[:, np.newaxis])
+                         for index, weight in self.row_taps]
+
+    @staticmethod
+    def get_taps(in_size, out_size, dtype):
+        """Two (input index, weight) taps per output pixel along one axis.
+        Output pixel centers map back to input coordinates like skimage's
+        warp, and taps falling outside the input get weight zero (its
+        default constant mode)."""
+        scale = float(in_size) / out_size
+        coords = (np.arange(out_size) + 0.5) * scale - 0.5
+        lower = np.floor(coords).astype(np.int64)
+        fraction = coords - lower
+        ret = []
+        for index, weight in ((lower, 1 - fraction), (lower + 1, fraction)):
+            inside = (index >= 0) & (index < in_size)
+            ret.append((np.clip(index, 0, in_size - 1),
+                        np.where(inside, weight, 0).astype(dtype)))
+        return ret
+
+    def resize(self, frames, out=None):
+        """Resize one (H, W) frame or an (N, H, W) batch of frames.
+        out: optional preallocated output; integer outputs are rounded."""
+        frames = np.asarray(frames, dtype=self.dtype)
+        (row_0, row_weight_0), (row_1, row_weight_1) = self.row_taps
+        rows = frames[..., row_0, :] * row_weight_0
+        rows += frames[..., row_1, :] * row_weight_1
+        (col_0, col_weight_0), (col_1, col_weight_1) = self.col_taps
+        ret = rows[..., col_0] * col_weight_0
+        ret += rows[..., col_1] * col_weight_1
+        if out is None:
+            return ret
+        if np.issubdtype(out.dtype, np.integer):
+            ret = np.rint(ret, out=ret)
+        out[...] = ret
+        return out
+
+
+class FramePreprocessor(object):
+    """
+    Turns a batch of raw ALE screens into network input frames with
+    whole-array operations: palette index to gray level, downsample, then
+    the action sidebar in the last columns.
+
+    The frames can come from one emulator's frame-skip window or from
+    several emulators, so Python overhead is paid once per batch rather than
+    once per frame.
+
+    gray: palette index to gray level lookup table (NTSCPalette.gray).
+    sidebars: ActionSidebarImages.images, sidebar image by action value.
+    """
+    def __init__(self, gray, sidebars, in_shape=(SCREEN_HEIGHT, SCREEN_WIDTH),
+                 out_shape=(RESIZED_HEIGHT, RESIZED_WIDTH)):
+        self.in_shape = in_shape
+        self.gray = np.asarray(gray, dtype=np.float32)
+        self.downsampler = Downsampler(in_shape, out_shape)
+        sidebar_width = sidebars.values()[0].shape[1]
+        self.sidebars = np.zeros((max(sidebars) + 1, out_shape[0],
+                                  sidebar_width), dtype=np.float32)
+        for value, image in sidebars.iteritems():
+            self.sidebars[value] = image
+        self.frame_shape = (out_shape[0], out_shape[1] + sidebar_width)
+        self.width = out_shape[1]
+
+    def allocate(self, num):
+        return np.empty((num,) + self.frame_shape, dtype=np.float32)
+
+    def process(self, screens, action_values, out=None):
+        """
+        screens: (N, H * W) or (N, H, W) uint8 palette indices.
+        action_values: atari_actions value of the action shown in each
+            frame's sidebar.
+        out: optional preallocated (N, 84, 84) output, see allocate.
+        Returns (N, 84, 84) float32 frames.
+        """
+        screens = np.asarray(screens)
+        num = len(screens)
+        if out is None:
+            out = self.allocate(num)
+        gray = self.gray[screens.reshape((num,) + self.in_shape)]
+        self.downsampler.resize(gray, out[:, :, :self.width])
+        out[:, :, self.width:] = self.sidebars[np.asarray(action_values)]
+        return out
@@ -0,0 +1,624 @@
+import errno
+import os
+
+import numpy as np
+
+from constants import EXP_IMAGE_ACTION_INDEX, EXP_ACTION_INDEX, \
+    EXP_GAME_OVER_INDEX, EXP_REWARD_INDEX, REPLAY_BYTES, \
+    INTEGRATE_HUMAN_FEEDBACK
+from sum_tree import SumTree
+
+# One step is the frame-skip window returned by Atari.experience.
+FRAMES_PER_STEP = 4
+FRAME_HEIGHT    = 84
+FRAME_WIDTH     = 84  # 80 screen columns + 4 action sidebar columns.
+
+# Frames, then per-step action, score, game over and linked flag, then one
+# entry of the episode end index.
+STEP_BYTES = FRAMES_PER_STEP * FRAME_HEIGHT * FRAME_WIDTH + 1 + 4 + 1 + 1 + \
+    8 + 1
+
+# Rejection rounds when sampling; only episode boundaries get rejected.
+MAX_SAMPLE_DRAWS = 10
+
+# Proportional prioritization constants from Schaul et al. 2015.
+PRIORITY_ALPHA   = 0.6
+PRIORITY_BETA    = 0.4
+PRIORITY_EPSILON = 1E-6
+
+# Reward classes of transitions, by the reward of the next state, and the
+# default share of each in a stratified minibatch.
+REWARD_POSITIVE = 0
+REWARD_NEGATIVE = 1
+REWARD_ZERO     = 2
+NUM_REWARD_CLASSES   = 3
+DEFAULT_CLASS_QUOTAS = (0.25, 0.25, 0.5)
+
+# Header fields of an on-disk replay memory.
+HEADER_CAPACITY = 0
+HEADER_CURSOR   = 1
+HEADER_SIZE     = 2
+HEADER_EVICTED  = 3
+HEADER_ENDS     = 4
+HEADER_LENGTH   = 5
+
+# Steps per snapshot segment (~115 MB of frames). Only segments appended to
+# since the last snapshot are rewritten.
+SEGMENT_STEPS = 4096
+ARRAY_NAMES = ['frames', 'actions', 'scores', 'game_overs', 'linked',
+               'episode_ends', 'end_game_overs']
+
+# Per-transition arrays of a TransitionBatch, in constructor order.
+BATCH_ARRAY_NAMES = ['slots', 'states', 'next_states', 'actions', 'scores',
+                     'game_overs', 'steps_to_game_over']
+
+
+class ReplayMemory(object):
+    """
+    Ring buffer of preallocated uint8 frames with parallel per-step action,
+    score (summed frame rewards) and game over arrays.
+
+    Capacity is either given in steps or derived from byte_budget, so the
+    memory footprint is fixed up front. Once full, each append evicts the
+    oldest step in O(1).
+
+    Each append stores one step (FRAMES_PER_STEP frames) in the next slot.
+    A transition is a pair of consecutive slots from the same episode and is
+    addressed by the slot of its first step, so every frame is stored once
+    and states are just index windows into the frame array.
+
+    Steps are also numbered in append order (evictions + offset from the
+    oldest slot). episode_ends is a ring of the step numbers that ended an
+    episode, in increasing order, with end_game_overs telling whether the
+    episode ended in a game over. Distances to the next game over are
+    looked up with searchsorted instead of scanning frames.
+
+    If directory is given, every array is an np.memmap file in it, together
+    with a small header holding the capacity, write cursor and fill level.
+    Opening an existing directory resumes where the last run left off, and
+    capacity may exceed physical memory since the OS pages frames in and
+    out.
+
+    sequence is twice the number of steps appended, plus one while an
+    append is in progress, for readers in other processes to detect steps
+    overwritten while they read (see get_overwritten).
+    """
+    step_bytes = STEP_BYTES
+
+    def __init__(self, capacity=None, directory=None, byte_budget=REPLAY_BYTES):
+        if capacity is None:
+            capacity = byte_budget // self.step_bytes
+        frame_capacity  = capacity * FRAMES_PER_STEP
+        self.capacity   = capacity
+        self.directory  = directory
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.header     = self.allocate('header', HEADER_LENGTH, np.int64)
+        self.sequence   = self.allocate('sequence', 1, np.int64)
+        if self.header[HEADER_CAPACITY] == 0:
+            self.header[HEADER_CAPACITY] = capacity
+        elif self.header[HEADER_CAPACITY] != capacity:
+            raise Exception('replay memory in %s has capacity %d, not %d' %
+                            (directory, self.header[HEADER_CAPACITY], capacity))
+        self.frames     = self.allocate(
+            'frames', (frame_capacity, FRAME_HEIGHT, FRAME_WIDTH), np.uint8)
+        self.actions    = self.allocate('actions',    capacity, np.uint8)
+        self.scores     = self.allocate('scores',     capacity, np.int32)
+        self.game_overs = self.allocate('game_overs', capacity, np.bool_)
+        # Whether the step in a slot continues the episode of the slot before.
+        self.linked     = self.allocate('linked',     capacity, np.bool_)
+        self.episode_ends   = self.allocate('episode_ends',   capacity, np.int64)
+        self.end_game_overs = self.allocate('end_game_overs', capacity, np.bool_)
+        self.dirty      = set()  # Segments changed since the last snapshot.
+        if self.sequence[0] < 2 * self.appends:
+            # A directory from before sequence was kept.
+            self.sequence[0] = 2 * self.appends
+        if self.size:
+            print 'reopened replay memory in', directory, 'with', self.size, \
+                'steps'
+        print 'replay memory capacity', capacity, 'steps,', \
+            self.capacity_bytes, 'bytes'
+
+    def allocate(self, name, shape, dtype):
+        if self.directory is None:
+            return np.zeros(shape, dtype=dtype)
+        filename = os.path.join(self.directory, name + '.dat')
+        if not os.path.exists(filename):
+            # Create the file at full size under another name and link it
+            # into place, so of several processes opening the memory at
+            # once only one creates it and none sees it half made.
+            temp_filename = '%s.%d.tmp' % (filename, os.getpid())
+            with open(temp_filename, 'wb') as temp_file:
+                temp_file.truncate(np.prod(shape) * np.dtype(dtype).itemsize)
+            try:
+                os.link(temp_filename, filename)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            finally:
+                os.remove(temp_filename)
+        return np.memmap(filename, dtype=dtype, mode='r+', shape=shape)
+
+    @property
+    def cursor(self):
+        """Next slot to write."""
+        return int(self.header[HEADER_CURSOR])
+
+    @cursor.setter
+    def cursor(self, value):
+        self.header[HEADER_CURSOR] = value
+
+    @property
+    def size(self):
+        """Number of slots holding a step."""
+        return int(self.header[HEADER_SIZE])
+
+    @size.setter
+    def size(self, value):
+        self.header[HEADER_SIZE] = value
+
+    @property
+    def evictions(self):
+        """Number of steps overwritten since the memory was created."""
+        return int(self.header[HEADER_EVICTED])
+
+    @property
+    def appends(self):
+        """Number of steps appended since the memory was created."""
+        return self.size + self.evictions
+
+    @property
+    def resident_bytes(self):
+        return self.size * self.step_bytes
+
+    @property
+    def capacity_bytes(self):
+        return self.capacity * self.step_bytes
+
+    def flush(self):
+        if self.directory is not None:
+            for name in ARRAY_NAMES + ['header', 'sequence']:
+                getattr(self, name).flush()
+
+    def snapshot(self, directory):
+        """Write segments changed since the last snapshot as .npy files in
+        directory, then the header. Memory-mapped memories just flush."""
+        if self.directory is not None:
+            self.flush()
+            return
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        print 'snapshotting', len(self.dirty), 'replay segments to', directory
+        for segment in sorted(self.dirty):
+            for name in ARRAY_NAMES:
+                np.save(self.get_segment_path(directory, name, segment),
+                        getattr(self, name)[self.get_segment_range(name, segment)])
+        # Header last, so a half-written snapshot restores the previous fill.
+        header_path = os.path.join(directory, 'header.npy')
+        np.save(header_path + '.tmp.npy', self.header)
+        os.rename(header_path + '.tmp.npy', header_path)
+        self.dirty.clear()
+
+    def restore(self, directory):
+        """Bulk load a snapshot written by snapshot."""
+        if self.directory is not None:
+            return
+        header = np.load(os.path.join(directory, 'header.npy'))
+        if header[HEADER_CAPACITY] != self.capacity:
+            raise Exception('replay snapshot in %s has capacity %d, not %d' %
+                            (directory, header[HEADER_CAPACITY], self.capacity))
+        num_segments = (self.capacity + SEGMENT_STEPS - 1) // SEGMENT_STEPS
+        for segment in xrange(num_segments):
+            for name in ARRAY_NAMES:
+                path = self.get_segment_path(directory, name, segment)
+                if os.path.exists(path):
+                    getattr(self, name)[self.get_segment_range(name, segment)] = \
+                        np.load(path)
+        self.header[:] = header
+        self.sequence[0] = 2 * self.appends
+        self.dirty.clear()
+        print 'restored replay memory from', directory, 'with', self.size, \
+            'steps'
+
+    def get_segment_range(self, name, segment):
+        items_per_slot = len(getattr(self, name)) // self.capacity
+        start = segment * SEGMENT_STEPS
+        end = min(start + SEGMENT_STEPS, self.capacity)
+        return slice(start * items_per_slot, end * items_per_slot)
+
+    @staticmethod
+    def get_segment_path(directory, name, segment):
+        return os.path.join(directory, '%s_%05d.npy' % (name, segment))
+
+    def __len__(self):
+        return self.size
+
+    def append(self, experience, linked):
+        """Store one step of (image_action, action, game_over, reward) frames.
+        linked: True if the step directly follows the last appended step in
+        the same episode.
+        """
+        slot = self.cursor
+        step = self.appends
+        self.sequence[0] = 2 * step + 1
+        if not linked and self.size and not self.game_overs[self.newest()]:
+            # The previous episode was cut short without a game over.
+            self.add_episode_end(step - 1, False)
+        start = slot * FRAMES_PER_STEP
+        end = start + FRAMES_PER_STEP
+        # Gray levels stay below 256 so rounding to uint8 is lossless enough.
+        self.frames[start:end] = np.rint(
+            [e[EXP_IMAGE_ACTION_INDEX] for e in experience])
+        self.actions   [slot] = experience[0][EXP_ACTION_INDEX].index
+        self.scores    [slot] = sum([e[EXP_REWARD_INDEX]    for e in experience])
+        self.game_overs[slot] = any([e[EXP_GAME_OVER_INDEX] for e in experience])
+        self.linked    [slot] = linked
+        if self.game_overs[slot]:
+            self.add_episode_end(step, True)
+        self.dirty.add(slot // SEGMENT_STEPS)
+        self.cursor = (slot + 1) % self.capacity
+        if self.size == self.capacity:
+            self.header[HEADER_EVICTED] += 1
+        else:
+            self.size += 1
+        self.sequence[0] = 2 * step + 2
+        return slot
+
+    def get_overwritten(self, slots, sequence):
+        """Whether the transition starting at each slot may have been
+        overwritten, or be in the middle of it, since self.sequence was
+        sequence. Lets a reader check rows it gathered without locks while
+        another process appends."""
+        slots = np.asarray(slots)
+        # Appends in progress at either end count.
+        first = int(sequence) // 2
+        num = (int(self.sequence[0]) + 1) // 2 - first
+        if num <= 0:
+            return np.zeros(len(slots), dtype=np.bool_)
+        if num >= self.capacity - 1:
+            return np.ones(len(slots), dtype=np.bool_)
+        # Step n goes to slot n % capacity, a transition also reads the slot
+        # after its own.
+        offsets = (slots - first) % self.capacity
+        return (offsets < num) | (offsets == self.capacity - 1)
+
+    def add_episode_end(self, step, game_over):
+        position = self.header[HEADER_ENDS] % self.capacity
+        self.episode_ends  [position] = step
+        self.end_game_overs[position] = game_over
+        self.dirty.add(position // SEGMENT_STEPS)
+        self.header[HEADER_ENDS] += 1
+
+    def get_steps(self, slots):
+        """Append order number of the step in each slot."""
+        return self.evictions + (slots - self.oldest()) % self.capacity
+
+    def get_steps_to_game_over(self, slots):
+        """Steps from each slot to the game over that ends its episode, or -1
+        if its episode hasn't ended or ended some other way."""
+        steps = self.get_steps(slots)
+        ret = -np.ones(len(steps), dtype=np.int64)
+        num_ends = int(self.header[HEADER_ENDS])
+        if num_ends <= self.capacity:
+            parts = [(0, num_ends)]
+        else:
+            # The ring has wrapped, its older half starts at the write position.
+            position = num_ends % self.capacity
+            parts = [(position, self.capacity), (0, position)]
+        pending = np.ones(len(steps), dtype=np.bool_)
+        for start, end in parts:
+            if start == end:
+                continue
+            i = start + np.searchsorted(self.episode_ends[start:end], steps)
+            found = pending & (i < end)
+            i = np.minimum(i, end - 1)
+            distances = np.where(self.end_game_overs[i],
+                                 self.episode_ends[i] - steps, -1)
+            ret[found] = distances[found]
+            pending &= ~found
+        return ret
+
+    def newest(self):
+        return (self.cursor - 1) % self.capacity
+
+    def oldest(self):
+        return (self.cursor - self.size) % self.capacity
+
+    def is_valid(self, slots):
+        """Whether each slot starts a transition, i.e. the following slot holds
+        the next step of the same episode."""
+        slots = np.asarray(slots)
+        following = (slots + 1) % self.capacity
+        return (slots != self.newest()) & self.linked[following]
+
+    def sample_slots(self, num, skip_oldest=0):
+        """Draw num independent, uniformly random transition slots.
+        Cost depends on num only, not on the number of stored steps.
+        skip_oldest: number of oldest steps never to draw."""
+        ret = np.empty(0, dtype=np.int64)
+        oldest, size = self.oldest(), self.size
+        if size < skip_oldest + 2:
+            return ret
+        for _ in xrange(MAX_SAMPLE_DRAWS):
+            draw = (oldest + np.random.randint(skip_oldest, size, num)) % \
+                self.capacity
+            ret = np.concatenate((ret, draw[self.is_valid(draw)]))
+            if len(ret) >= num:
+                break
+        return ret[:num]
+
+    def sample(self, num):
+        return self.gather(self.sample_slots(num))
+
+    def gather(self, slots):
+        """Copy the transitions starting at slots into a TransitionBatch with
+        one fancy-indexing pass per array."""
+        following = (slots + 1) % self.capacity
+        window = slots[:, np.newaxis] * FRAMES_PER_STEP + \
+            np.arange(2 * FRAMES_PER_STEP)
+        window %= self.capacity * FRAMES_PER_STEP
+        return TransitionBatch(
+            slots,
+            self.frames.take(window[:, :FRAMES_PER_STEP], axis=0).astype(np.float32),
+            self.frames.take(window[:, FRAMES_PER_STEP:], axis=0).astype(np.float32),
+            self.actions.take(following),
+            self.scores .take(following),
+            np.column_stack((self.game_overs.take(slots),
+                             self.game_overs.take(following))),
+            self.get_steps_to_game_over(following))
+
+    def update_priorities(self, slots, td_errors):
+        """Uniform replay ignores TD errors."""
+        pass
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+    Replay memory sampled in proportion to |TD error| ^ alpha.
+
+    A SumTree over slots holds the priority of the transition starting at
+    each slot. Slots that don't start a transition (the newest step and
+    episode ends) have priority zero, so they are never drawn. New
+    transitions get the highest priority seen so far.
+    """
+    # Worst case sum-tree nodes per slot.
+    step_bytes = STEP_BYTES + 4 * np.dtype(np.float64).itemsize
+
+    def __init__(self, capacity=None, directory=None, byte_budget=REPLAY_BYTES,
+                 alpha=PRIORITY_ALPHA, beta=PRIORITY_BETA):
+        super(PrioritizedReplayMemory, self).__init__(capacity, directory,
+                                                      byte_budget)
+        self.alpha = alpha
+        self.beta = beta
+        self.tree = SumTree(self.capacity)
+        self.max_priority = 1.0
+        if self.size:
+            self.reset_priorities()
+
+    def reset_priorities(self):
+        """Priorities aren't persisted, so reloaded transitions start equal."""
+        slots = np.arange(self.capacity)
+        priorities = np.where(self.is_valid(slots), self.max_priority, 0.0)
+        self.tree.update(slots, priorities)
+
+    def restore(self, directory):
+        super(PrioritizedReplayMemory, self).restore(directory)
+        self.reset_priorities()
+
+    def append(self, experience, linked):
+        slot = super(PrioritizedReplayMemory, self).append(experience, linked)
+        if linked:
+            previous = (slot - 1) % self.capacity
+            self.tree.update([slot, previous], [0.0, self.max_priority])
+        else:
+            self.tree.update([slot], [0.0])
+        return slot
+
+    def sample_slots(self, num, skip_oldest=0):
+        """One draw from each of num equal slices of the total priority.
+        skip_oldest: number of oldest steps never to draw, draws of them are
+        rejected and drawn again."""
+        ret = np.empty(0, dtype=np.int64)
+        total = self.tree.total()
+        if total <= 0 or self.size < skip_oldest + 2:
+            return ret
+        oldest = self.oldest()
+        for _ in xrange(MAX_SAMPLE_DRAWS):
+            values = (np.arange(num) + np.random.uniform(size=num)) * total / num
+            draw = self.tree.find(np.minimum(values, np.nextafter(total, 0)))
+            ret = np.concatenate(
+                (ret, draw[(draw - oldest) % self.capacity >= skip_oldest]))
+            if len(ret) >= num:
+                break
+        return ret[:num]
+
+    def sample(self, num):
+        slots = self.sample_slots(num)
+        ret = self.gather(slots)
+        if not len(slots):
+            return ret
+        # Importance sampling weights, normalized so the largest is 1.
+        probabilities = self.tree.get(slots) / self.tree.total()
+        weights = (self.size * probabilities) ** -self.beta
+        ret.weights = weights / weights.max()
+        return ret
+
+    def update_priorities(self, slots, td_errors):
+        priorities = (np.abs(td_errors) + PRIORITY_EPSILON) ** self.alpha
+        self.tree.update(slots, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+
+class StratifiedReplayMemory(ReplayMemory):
+    """
+    Replay memory sampled with a fixed share of positive, negative and zero
+    reward transitions per minibatch.
+
+    Each reward class keeps a dense array of the slots starting one of its
+    transitions, and every slot remembers its position in that array, so
+    adding or evicting a transition is an O(1) swap with the last entry and
+    each draw is one random position in its class's array.
+
+    quotas: share of the minibatch for REWARD_POSITIVE, REWARD_NEGATIVE and
+    REWARD_ZERO. The share of an empty class is spread over the others.
+    """
+    # One entry per class array, plus position and class of each slot.
+    step_bytes = STEP_BYTES + NUM_REWARD_CLASSES * 4 + 4 + 1
+
+    def __init__(self, capacity=None, directory=None, byte_budget=REPLAY_BYTES,
+                 quotas=DEFAULT_CLASS_QUOTAS):
+        super(StratifiedReplayMemory, self).__init__(capacity, directory,
+                                                     byte_budget)
+        if len(quotas) != NUM_REWARD_CLASSES:
+            raise Exception('need %d reward class quotas, got %r' %
+                            (NUM_REWARD_CLASSES, quotas))
+        self.quotas = np.array(quotas, dtype=np.float64)
+        self.class_slots = np.empty((NUM_REWARD_CLASSES, self.capacity),
+                                    dtype=np.int32)
+        self.class_sizes    = np.zeros(NUM_REWARD_CLASSES, dtype=np.int64)
+        self.slot_positions = np.empty(self.capacity, dtype=np.int32)
+        self.slot_classes   = np.empty(self.capacity, dtype=np.int8)
+        self.reset_classes()
+
+    def get_reward_classes(self, slots):
+        """Class of the transition starting at each slot, following
+        Atari.get_reward_from_experience for its next state."""
+        following = (np.asarray(slots) + 1) % self.capacity
+        scores = self.scores.take(following)
+        ret = np.where(scores > 0, REWARD_POSITIVE,
+                       np.where(scores < 0, REWARD_NEGATIVE, REWARD_ZERO))
+        # Game over is replaced by crowdsourced-detected deaths when
+        # integrating human feedback.
+        ret[self.game_overs.take(following)] = \
+            REWARD_ZERO if INTEGRATE_HUMAN_FEEDBACK else REWARD_NEGATIVE
+        return ret
+
+    def reset_classes(self):
+        """Rebuild the class arrays from the stored steps."""
+        self.slot_classes[:] = -1
+        slots = np.arange(self.capacity)
+        slots = slots[self.is_valid(slots)] if self.size else slots[:0]
+        classes = self.get_reward_classes(slots)
+        for reward_class in xrange(NUM_REWARD_CLASSES):
+            members = slots[classes == reward_class]
+            self.class_sizes[reward_class] = len(members)
+            self.class_slots[reward_class, :len(members)] = members
+            self.slot_positions[members] = np.arange(len(members))
+            self.slot_classes[members] = reward_class
+
+    def restore(self, directory):
+        super(StratifiedReplayMemory, self).restore(directory)
+        self.reset_classes()
+
+    def add(self, slot, reward_class):
+        position = self.class_sizes[reward_class]
+        self.class_slots[reward_class, position] = slot
+        self.slot_positions[slot] = position
+        self.slot_classes[slot] = reward_class
+        self.class_sizes[reward_class] += 1
+
+    def remove(self, slot):
+        reward_class = self.slot_classes[slot]
+        if reward_class < 0:
+            return
+        # Move the class's last slot into the hole.
+        last = self.class_sizes[reward_class] - 1
+        moved = self.class_slots[reward_class, last]
+        position = self.slot_positions[slot]
+        self.class_slots[reward_class, position] = moved
+        self.slot_positions[moved] = position
+        self.slot_classes[slot] = -1
+        self.class_sizes[reward_class] = last
+
+    def append(self, experience, linked):
+        # The step being overwritten no longer starts a transition.
+        self.remove(self.cursor)
+        slot = super(StratifiedReplayMemory, self).append(experience, linked)
+        if linked:
+            previous = (slot - 1) % self.capacity
+            self.add(previous, self.get_reward_classes([previous])[0])
+        return slot
+
+    def get_class_counts(self, num):
+        """Transitions of each class in a minibatch of num."""
+        quotas = np.where(self.class_sizes > 0, self.quotas, 0.0)
+        if quotas.sum() <= 0:
+            return np.zeros(NUM_REWARD_CLASSES, dtype=np.int64)
+        quotas /= quotas.sum()
+        ret = np.floor(num * quotas).astype(np.int64)
+        # Hand out what rounding left over at random, in proportion.
+        ret += np.random.multinomial(num - ret.sum(), quotas)
+        return ret
+
+    def sample_slots(self, num):
+        ret = []
+        for reward_class, count in enumerate(self.get_class_counts(num)):
+            positions = np.random.randint(0, max(self.class_sizes[reward_class], 1),
+                                          count)
+            ret.append(self.class_slots[reward_class, positions])
+        return np.concatenate(ret).astype(np.int64)
+
+
+class TransitionBatch(object):
+    """
+    Minibatch of transitions from state s to next state s'.
+
+    states and next_states are contiguous float32 (N, FRAMES_PER_STEP, 84, 84)
+    arrays that can be handed to set_input_arrays as is.
+    actions: index of the action taken in s', as in atari_actions.ALL.
+    scores: sum of the frame rewards of s'.
+    game_overs: (N, 2) whether s and s' contain a game over.
+    steps_to_game_over: steps from s' to the game over ending its episode,
+        or -1 if there is none.
+    weights: importance sampling weights, or None for uniform batches.
+    """
+    def __init__(self, slots, states, next_states, actions, scores,
+                 game_overs, steps_to_game_over, weights=None):
+        self.slots              = slots
+        self.states             = states
+        self.next_states        = next_states
+        self.actions            = actions
+        self.scores             = scores
+        self.game_overs         = game_overs
+        self.steps_to_game_over = steps_to_game_over
+        self.weights            = weights
+
+    def __len__(self):
+        return len(self.slots)
+
+    def take(self, rows):
+        """Batch of the given rows, e.g. a boolean mask."""
+        ret = TransitionBatch(*[getattr(self, name)[rows]
+                                for name in BATCH_ARRAY_NAMES])
+        if self.weights is not None:
+            ret.weights = self.weights[rows]
+        return ret
+
+    @staticmethod
+    def concatenate(batches):
+        return TransitionBatch(*[np.concatenate([getattr(b, name)
+                                                 for b in batches])
+                                 for name in BATCH_ARRAY_NAMES])
+
+    @staticmethod
+    def from_pairs(pairs):
+        """Batch from (experience, experience) pairs in the Atari.experience
+        format, such as the ones loaded by experience_loader."""
+        def get_images(step):
+            return np.array([[e[EXP_IMAGE_ACTION_INDEX] for e in pair[step]]
+                             for pair in pairs], dtype=np.float32)
+
+        def get_game_over(experience):
+            return any([e[EXP_GAME_OVER_INDEX] for e in experience])
+
+        num = len(pairs)
+        return TransitionBatch(
+            -np.ones(num, dtype=np.int64),  # Not in a replay memory.
+            get_images(0),
+            get_images(1),
+            np.array([pair[1][0][EXP_ACTION_INDEX].index for pair in pairs]),
+            np.array([sum([e[EXP_REWARD_INDEX] for e in pair[1]])
+                      for pair in pairs]),
+            np.array([[get_game_over(pair[0]), get_game_over(pair[1])]
+                      for pair in pairs], dtype=np.bool_).reshape(num, 2),
+            -np.ones(num, dtype=np.int64))
@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+
+from constants import REPLAY_BYTES
+from replay import ReplayMemory, TransitionBatch
+
+SHM_ROOT = '/dev/shm'
+
+# Oldest steps of each region the learner won't draw, since the region's
+# actor may be overwriting them while a batch is gathered. Rows overwritten
+# anyway are found with the region's sequence and dropped.
+REGION_GUARD_STEPS = 8
+
+# Learner parameters published to the actors, in the shared directory.
+WEIGHTS_FILE_NAME = 'weights.caffemodel'
+
+
+class SharedReplayMemory(object):
+    """
+    Replay memory in POSIX shared memory, filled by several actor processes
+    and sampled by a learner.
+
+    Each actor owns one region: a memory-mapped ReplayMemory under
+    /dev/shm/<name>/actor_<i>. Only that actor appends to it, so appends
+    need no locks. Reads are checked seqlock style instead: the learner
+    notes the region's sequence before gathering a batch and afterwards
+    drops the rows the actor overwrote in between. Sampling spreads a
+    minibatch over regions in proportion to their size.
+
+    With name None the regions are ordinary in-process memories, one per
+    emulator of a VectorAtari, since each region holds a single episode
+    stream.
+
+    The learner publishes its parameters to weights_path every so often
+    and the actors reload them, see DqnSolver.sync_actor_weights.
+    """
+    def __init__(self, name, num_actors, actor_id=0, byte_budget=REPLAY_BYTES):
+        self.directory = os.path.join(SHM_ROOT, name) if name else None
+        self.actor_id = actor_id
+        self.regions = []
+        for i in xrange(num_actors):
+            self.regions.append(ReplayMemory(
+                capacity=byte_budget // num_actors // ReplayMemory.step_bytes,
+                directory=self.get_region_dir(self.directory, i)))
+        self.capacity = sum(r.capacity for r in self.regions)
+        if self.directory is None:
+            self.weights_path = None
+        else:
+            self.weights_path = os.path.join(self.directory, WEIGHTS_FILE_NAME)
+
+    def __len__(self):
+        return sum(len(r) for r in self.regions)
+
+    @property
+    def evictions(self):
+        return sum(r.evictions for r in self.regions)
+
+    @property
+    def resident_bytes(self):
+        return sum(r.resident_bytes for r in self.regions)
+
+    @property
+    def capacity_bytes(self):
+        return sum(r.capacity_bytes for r in self.regions)
+
+    @staticmethod
+    def get_region_dir(directory, region):
+        if directory is None:
+            return None
+        return os.path.join(directory, 'actor_%d' % region)
+
+    def append(self, experience, linked):
+        return self.regions[self.actor_id].append(experience, linked)
+
+    def sample(self, num):
+        sizes = np.array([max(len(r) - REGION_GUARD_STEPS, 0)
+                          for r in self.regions], dtype=np.float64)
+        if not sizes.sum():
+            # Nothing readable yet, e.g. the actors have just started.
+            return self.regions[0].gather(np.empty(0, dtype=np.int64))
+        counts = np.random.multinomial(num, sizes / sizes.sum())
+        batches = []
+        for i, (region, count) in enumerate(zip(self.regions, counts)):
+            if count:
+                sequence = region.sequence[0]
+                slots = region.sample_slots(count,
+                                            skip_oldest=REGION_GUARD_STEPS)
+                batch = region.gather(slots)
+                overwritten = region.get_overwritten(slots, sequence)
+                if overwritten.any():
+                    print 'dropped', overwritten.sum(), 'transitions of region', \
+                        i, 'overwritten while read'
+                    batch = batch.take(~overwritten)
+                batches.append(batch)
+        return TransitionBatch.concatenate(batches)
+
+    def update_priorities(self, slots, td_errors):
+        pass
+
+    def snapshot(self, directory):
+        # Shared regions live in shared memory until the machine reboots and
+        # just flush.
+        for i, region in enumerate(self.regions):
+            region.snapshot(self.get_region_dir(directory, i))
+
+    def restore(self, directory):
+        for i, region in enumerate(self.regions):
+            region_dir = self.get_region_dir(directory, i)
+            if os.path.exists(region_dir):
+                region.restore(region_dir)
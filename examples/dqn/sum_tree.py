@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class SumTree(object):
+    """
+    Binary tree stored in a flat array where each node holds the sum of its
+    children's priorities. Leaves are addressed by index in [0, capacity).
+    Node 1 is the root and node i has children 2i and 2i + 1.
+
+    Lookups and updates walk one level at a time for a whole batch, so both
+    cost O(log capacity) vectorized numpy operations.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.leaf_offset = 1
+        while self.leaf_offset < capacity:
+            self.leaf_offset *= 2
+        self.nodes = np.zeros(2 * self.leaf_offset, dtype=np.float64)
+
+    def total(self):
+        return self.nodes[1]
+
+    def get(self, indices):
+        return self.nodes[np.asarray(indices) + self.leaf_offset]
+
+    def update(self, indices, priorities):
+        """Set leaf priorities and recompute the sums above them once per
+        level."""
+        leaves = np.asarray(indices, dtype=np.int64) + self.leaf_offset
+        if len(leaves) == 0:
+            return
+        self.nodes[leaves] = priorities
+        parents = np.unique(leaves // 2)
+        while parents[0] > 0:
+            self.nodes[parents] = \
+                self.nodes[2 * parents] + self.nodes[2 * parents + 1]
+            parents = np.unique(parents // 2)
+
+    def find(self, values):
+        """Leaf index whose cumulative priority interval contains each value
+        in [0, total)."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while len(nodes) and nodes[0] < self.leaf_offset:
+            left = 2 * nodes
+            left_sums = self.nodes[left]
+            # Never step into an empty subtree because of rounding.
+            go_right = (values >= left_sums) & (self.nodes[left + 1] > 0)
+            values -= np.where(go_right, left_sums, 0)
+            nodes = left + go_right
+        return nodes - self.leaf_offset
@@ -0,0 +1,288 @@
+"""
+Run from examples/dqn with
+    python -m unittest test_dqn
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+# Must be set before constants are imported.
+os.environ.setdefault('REPLAY_BYTES', str(2 ** 24))
+
+import numpy as np
+
+from constants import EXP_IMAGE_ACTION_INDEX, EXP_ACTION_INDEX, \
+    EXP_GAME_OVER_INDEX, EXP_REWARD_INDEX
+import atari_actions as actions
+import dqn
+from dqn_solver import DqnSolver, GAME_OVER_STEPS, MAX_MINIBATCH_REWARD
+from replay import ReplayMemory, PrioritizedReplayMemory, TransitionBatch, \
+    FRAMES_PER_STEP, FRAME_HEIGHT, FRAME_WIDTH
+from sum_tree import SumTree
+
+CAPACITY = 16
+
+
+class FakeAtari(object):
+    def __init__(self, replay_memory):
+        self.replay_memory = replay_memory
+
+
+class FakeSolver(object):
+    def __init__(self, snapshot_prefix):
+        self.snapshot_prefix = snapshot_prefix
+
+
+def fill(memory, num, start=0):
+    """Append steps start to start + num as one episode."""
+    for step in xrange(start, start + num):
+        memory.append(get_experience(step), step > start)
+
+
+def get_experience(step):
+    ret = []
+    for i in xrange(FRAMES_PER_STEP):
+        e = [None] * (EXP_REWARD_INDEX + 1)
+        e[EXP_IMAGE_ACTION_INDEX] = np.full((FRAME_HEIGHT, FRAME_WIDTH),
+                                            step + i, dtype=np.float32)
+        e[EXP_ACTION_INDEX] = actions.FIRE
+        e[EXP_GAME_OVER_INDEX] = False
+        e[EXP_REWARD_INDEX] = step % 3
+        ret.append(e)
+    return ret
+
+
+class TestRestoreReplay(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.solver = FakeSolver(os.path.join(self.dir, 'dqn'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def snapshot(self, num):
+        memory = ReplayMemory(capacity=CAPACITY)
+        fill(memory, num)
+        memory.snapshot(dqn.utils.get_replay_snapshot_dir(self.solver))
+        return memory
+
+    def test_restores_into_empty_memory(self):
+        saved = self.snapshot(10)
+        atari = FakeAtari(ReplayMemory(capacity=CAPACITY))
+        dqn.restore_replay(atari, self.solver, 'dqn_iter_100.solverstate')
+        restored = atari.replay_memory
+        self.assertEqual(len(restored), 10)
+        self.assertEqual(restored.cursor, saved.cursor)
+        np.testing.assert_array_equal(restored.frames, saved.frames)
+        np.testing.assert_array_equal(restored.scores, saved.scores)
+
+    def test_fresh_start_leaves_memory_empty(self):
+        self.snapshot(10)
+        atari = FakeAtari(ReplayMemory(capacity=CAPACITY))
+        dqn.restore_replay(atari, self.solver, None)
+        self.assertEqual(len(atari.replay_memory), 0)
+
+    def test_no_replay_memory(self):
+        self.snapshot(10)
+        dqn.restore_replay(FakeAtari(None), self.solver,
+                           'dqn_iter_100.solverstate')
+
+
+class TestSumTree(unittest.TestCase):
+    def test_totals(self):
+        tree = SumTree(5)
+        tree.update([0, 1, 4], [1.0, 2.0, 3.0])
+        self.assertEqual(tree.total(), 6.0)
+        np.testing.assert_array_equal(tree.get([0, 1, 2, 4]), [1, 2, 0, 3])
+        tree.update([1], [0.5])
+        self.assertEqual(tree.total(), 4.5)
+
+    def test_find(self):
+        tree = SumTree(5)
+        tree.update(np.arange(5), [1.0, 0.0, 3.0, 0.0, 2.0])
+        np.testing.assert_array_equal(
+            tree.find([0.0, 0.99, 1.0, 3.99, 4.0, 5.99]), [0, 0, 2, 2, 4, 4])
+
+
+class TestReplayMemory(unittest.TestCase):
+    def test_valid_across_wrap(self):
+        memory = ReplayMemory(capacity=CAPACITY)
+        fill(memory, CAPACITY + 5)
+        self.assertEqual(memory.evictions, 5)
+        valid = memory.is_valid(np.arange(CAPACITY))
+        # Only the newest step doesn't start a transition.
+        self.assertEqual(list(np.flatnonzero(~valid)), [memory.newest()])
+        batch = memory.gather(np.flatnonzero(valid))
+        np.testing.assert_array_equal(batch.next_states[:, 0, 0, 0],
+                                      batch.states[:, 0, 0, 0] + 1)
+
+    def test_episode_boundary_is_invalid(self):
+        memory = ReplayMemory(capacity=CAPACITY)
+        fill(memory, 10)
+        last = memory.newest()
+        fill(memory, 3, start=100)
+        self.assertFalse(memory.is_valid([last])[0])
+        # 9 and 2 transitions, empty slots start none.
+        self.assertEqual(memory.is_valid(np.arange(CAPACITY)).sum(), 9 + 2)
+
+    def test_skip_oldest(self):
+        np.random.seed(0)
+        memory = ReplayMemory(capacity=CAPACITY)
+        fill(memory, CAPACITY + 5)
+        slots = memory.sample_slots(1000, skip_oldest=4)
+        ages = (slots - memory.oldest()) % CAPACITY
+        self.assertEqual(ages.min(), 4)
+
+    def test_overwritten_while_read(self):
+        memory = ReplayMemory(capacity=CAPACITY)
+        fill(memory, CAPACITY + 4)
+        sequence = memory.sequence[0]
+        fill(memory, 2, start=CAPACITY + 4)
+        # Steps 20 and 21 went to slots 4 and 5, and the transition of slot 3
+        # reads slot 4.
+        self.assertEqual(
+            list(np.flatnonzero(memory.get_overwritten(np.arange(CAPACITY),
+                                                       sequence))), [3, 4, 5])
+        self.assertFalse(memory.get_overwritten([3], memory.sequence[0])[0])
+
+    def test_shared_directory(self):
+        directory = tempfile.mkdtemp()
+        try:
+            writer = ReplayMemory(capacity=CAPACITY, directory=directory)
+            reader = ReplayMemory(capacity=CAPACITY, directory=directory)
+            fill(writer, 5)
+            self.assertEqual(len(reader), 5)
+            self.assertEqual(reader.sequence[0], 10)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestPrioritizedReplay(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.memory = PrioritizedReplayMemory(capacity=CAPACITY, alpha=1.0,
+                                              beta=0.5)
+        fill(self.memory, CAPACITY)
+        self.slots = np.arange(CAPACITY - 1)
+        self.memory.update_priorities(self.slots, self.slots + 1.0)
+        self.priorities = self.memory.tree.get(np.arange(CAPACITY))
+
+    def test_sampling_frequencies(self):
+        counts = np.zeros(CAPACITY)
+        for _ in xrange(200):
+            counts += np.bincount(self.memory.sample_slots(32),
+                                  minlength=CAPACITY)
+        expected = self.priorities / self.priorities.sum()
+        self.assertEqual(counts[CAPACITY - 1], 0)  # Newest never drawn.
+        np.testing.assert_allclose(counts / counts.sum(), expected, atol=0.01)
+
+    def test_importance_weights(self):
+        batch = self.memory.sample(32)
+        probabilities = self.priorities[batch.slots] / self.priorities.sum()
+        weights = (CAPACITY * probabilities) ** -0.5
+        np.testing.assert_allclose(batch.weights, weights / weights.max())
+        self.assertEqual(batch.weights.max(), 1.0)
+
+    def test_skip_oldest(self):
+        self.memory.append(get_experience(CAPACITY), True)  # Wrap once.
+        slots = self.memory.sample_slots(1000, skip_oldest=4)
+        self.assertEqual(len(slots), 1000)
+        ages = (slots - self.memory.oldest()) % CAPACITY
+        self.assertTrue(ages.min() >= 4)
+
+
+class OldRewards(object):
+    """The per-transition reward loop from before rewards were vectorized.
+    Experiences are lists of (reward, game_over) frames."""
+    @staticmethod
+    def get_reward(experience):
+        score = sum([reward for reward, _ in experience])
+        if OldRewards.get_game_over(experience):
+            return -1
+        return int(np.sign(score))
+
+    @staticmethod
+    def substitute(experience, reward):
+        return [(reward, game_over) for _, game_over in experience]
+
+    @staticmethod
+    def get_game_over(experience):
+        return any([game_over for _, game_over in experience])
+
+    def extend_game_over_into_past(self, pairs):
+        for i, (exp1, exp2) in enumerate(pairs):
+            if i >= GAME_OVER_STEPS - 1 and (self.get_game_over(exp1) or
+                                             self.get_game_over(exp2)):
+                start = max(0, i - GAME_OVER_STEPS)
+                reward = - MAX_MINIBATCH_REWARD / float(GAME_OVER_STEPS)
+                extended = [(self.substitute(e1, reward),
+                             self.substitute(e2, reward))
+                            for e1, e2 in pairs[start:i + 1]]
+                return pairs[:start] + extended + pairs[i + 1:]
+        return pairs
+
+    def normalize_rewards(self, pairs):
+        rewards = [self.get_reward(exp2) for _, exp2 in pairs]
+        death = any(r < 0 for r in rewards)
+        if death:
+            total = -sum(r for r in rewards if r < 0)
+        else:
+            total = sum(r for r in rewards if r >= 0)
+        ret = []
+        for (exp1, exp2), reward in zip(pairs, rewards):
+            new_reward = 0.0
+            if death and reward > 0:
+                new_reward = 0.0
+            elif total != 0 and reward != 0:
+                new_reward = 0.5 * float(reward) / total
+            ret.append((self.substitute(exp1, new_reward),
+                        self.substitute(exp2, new_reward)))
+        return ret
+
+    def get_rewards(self, pairs):
+        return np.array([self.get_reward(exp2) for _, exp2 in pairs])
+
+
+class TestRewards(unittest.TestCase):
+    """Vectorized minibatch rewards match the old loop on a contiguous
+    episode, where minibatch order was step order."""
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        num = GAME_OVER_STEPS + 8
+        # Frame rewards of steps 0 to num, the last one a game over.
+        frame_rewards = rng.choice([0, 0, 0, 5, 10],
+                                   (num + 1, FRAMES_PER_STEP))
+        steps = [[(reward, step == num) for reward in frame_rewards[step]]
+                 for step in xrange(num + 1)]
+        self.pairs = [(steps[i], steps[i + 1]) for i in xrange(num)]
+        game_overs = np.zeros((num, 2), dtype=np.bool_)
+        game_overs[-1, 1] = True
+        self.batch = TransitionBatch(
+            np.arange(num), np.zeros((num, 1)), np.zeros((num, 1)),
+            np.zeros(num, dtype=np.int64),
+            frame_rewards[1:].sum(axis=1), game_overs,
+            num - 1 - np.arange(num))
+        self.solver = DqnSolver.__new__(DqnSolver)
+        self.old = OldRewards()
+
+    def test_extend_game_over_into_past(self):
+        rewards = self.solver.extend_game_over_into_past(
+            self.batch, self.solver.get_rewards(self.batch))
+        old = self.old.get_rewards(
+            self.old.extend_game_over_into_past(self.pairs))
+        np.testing.assert_array_equal(rewards, old)
+        self.assertEqual((rewards == -1).sum(), GAME_OVER_STEPS + 1)
+
+    def test_normalize_rewards(self):
+        for num in [8, len(self.pairs)]:  # Without and with the death.
+            batch = self.batch.take(slice(-num, None))
+            rewards = self.solver.normalize_rewards(
+                self.solver.get_rewards(batch))
+            old = self.old.get_rewards(
+                self.old.normalize_rewards(self.pairs[-num:]))
+            np.testing.assert_array_equal(rewards, old)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import binascii
 import itertools
 import os
 import numpy as np
@@ -10,8 +11,13 @@ import skimage.transform
 # take an array of shape (n, height, width) or (n, height, width, channels)
 #  and visualize each (height, width) thing in a grid of size approx. sqrt(n) by sqrt(n)
 import sys
+import tempfile
 import time
-from constants import CAFFE_ROOT, DQN_ROOT
+from caffe.proto import caffe_pb2
+from google.protobuf import text_format
+from constants import CAFFE_ROOT, DQN_ROOT, MINIBATCH_SIZE
+
+TRAIN_NET_FILE = CAFFE_ROOT + 'examples/dqn/data/solver/dqn_train.prototxt'
 
 
 def vis_square(data, im_name, batch, padsize=1, padval=0):
@@ -78,10 +84,100 @@ def get_solver(solver_filename):
     return solver
 
 
+def get_net_param(name, batch_size):
+    """dqn_train.prototxt as a NetParameter named dqn_<name> that takes
+    batch_size states and only computes Q-values: without the Q loss layer
+    and the target and weight inputs only it reads."""
+    param = caffe_pb2.NetParameter()
+    with open(TRAIN_NET_FILE) as f:
+        text_format.Merge(f.read(), param)
+    param.name = 'dqn_' + name
+    loss_inputs = set()
+    for i in reversed(xrange(len(param.layers))):
+        layer = param.layers[i]
+        if layer.type == caffe_pb2.LayerParameter.Q_LOSS:
+            loss_inputs.update(layer.bottom)
+            del param.layers[i]
+        elif layer.type == caffe_pb2.LayerParameter.MEMORY_DATA:
+            layer.memory_data_param.batch_size = batch_size
+    # Four input_dim per input.
+    inputs = [(input_name, list(param.input_dim[4 * i:4 * i + 4]))
+              for i, input_name in enumerate(param.input)
+              if input_name not in loss_inputs]
+    del param.input[:]
+    del param.input_dim[:]
+    for input_name, dims in inputs:
+        param.input.append(input_name)
+        param.input_dim.extend(dims)
+    return param
+
+
+def get_net(name, batch_size, pretrained_file=None):
+    """caffe.Net of get_net_param(name, batch_size)."""
+    with tempfile.NamedTemporaryFile(prefix='dqn_%s_' % name,
+                                     suffix='.prototxt') as f:
+        f.write(text_format.MessageToString(get_net_param(name, batch_size)))
+        f.flush()
+        if pretrained_file:
+            return caffe.Net(f.name, pretrained_file)
+        return caffe.Net(f.name)
+
+
+def get_shared_net(solver, name, batch_size):
+    """Copy of the solver's net taking batch_size states, e.g. 'act' for the
+    states acted on, that runs on the solver's live parameters (shared, not
+    copied)."""
+    net = get_net(name, batch_size)
+    net.share_trained_layers_with(solver.net)
+    return net
+
+
+def get_target_net(solver):
+    """MINIBATCH_SIZE batch copy of the solver's net with parameters of its
+    own, initialized from and later synced with the solver's by
+    copy_trained_layers_from."""
+    net = get_net('target', MINIBATCH_SIZE)
+    net.copy_trained_layers_from(solver.net)
+    return net
+
+
+def load_trained_layers(solver, filename):
+    """Copy parameters written by Net.save, e.g. in another process, into
+    the solver's net and so every net sharing its parameters."""
+    solver.net.copy_trained_layers_from(get_net('act', 1, filename))
+
+
+def get_replay_snapshot_dir(solver):
+    # Sits next to the solver's own snapshot files.
+    return solver.snapshot_prefix + '_replay'
+
+
 def rgb2gray(rgb):
     return np.dot(rgb[..., :3], [0.299, 0.587, 0.144])
 
 
+def screen_hex_to_indices(screen_hex):
+    """ALE hex screen line to a flat uint8 array of palette indices."""
+    return np.fromstring(binascii.unhexlify(screen_hex), dtype=np.uint8)
+
+
+def rle_screen_hex_to_indices(screen_rle, num_pixels):
+    """ALE run-length encoded screen line to a flat uint8 array of palette
+    indices. Each run is two hex digits of palette index followed by two of
+    run length."""
+    runs = np.fromstring(binascii.unhexlify(screen_rle), dtype=np.uint8)
+    ret = np.repeat(runs[0::2], runs[1::2])
+    if len(ret) != num_pixels:
+        raise Exception('run length encoded screen has %d pixels, not %d' %
+                        (len(ret), num_pixels))
+    return ret
+
+
+def indices_to_screen_hex(screen):
+    """Inverse of screen_hex_to_indices, matching ALE's upper case hex."""
+    return binascii.hexlify(screen.tostring()).upper()
+
+
 def l1_norm(v):
     return np.linalg.norm(v, ord=1)
 
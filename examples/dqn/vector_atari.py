@@ -0,0 +1,69 @@
+import itertools
+
+from atari import Atari
+
+
+class VectorAtari(object):
+    """
+    NUM_ENVS emulators driven from one actor, each launched in its own FIFO
+    directory and recording to its own replay region.
+
+    Every frame of a step goes out to all emulators before the next one is
+    awaited, so while one screen is being read the others are already
+    emulating. The screens of all emulators are preprocessed together into
+    one stacked (N, n, 84, 84) observation batch for a batched Q
+    evaluation.
+    """
+    def __init__(self, num_envs, log_dir_name, start_timestamp, show=False):
+        self.envs = [Atari(log_dir_name, i, start_timestamp, show, env_id=i)
+                     for i in xrange(num_envs)]
+        self.preprocessor = self.envs[0].preprocessor
+        self.observations = None
+
+    def __len__(self):
+        return len(self.envs)
+
+    def __getitem__(self, env_id):
+        return self.envs[env_id]
+
+    @property
+    def replay_memory(self):
+        return self.envs[0].replay_memory
+
+    def experience(self, n, actions):
+        """ Step every emulator n frames with its action in actions.
+        Returns (experiences, observations): one experience per emulator,
+        and the (N, n, 84, 84) observations they are views of, valid until
+        the next step. """
+        if self.observations is None or self.observations.shape[1] != n:
+            self.observations = self.preprocessor.allocate(
+                len(self.envs) * n).reshape(
+                    (len(self.envs), n) + self.preprocessor.frame_shape)
+        raw_frames = [[] for _ in self.envs]
+        for _ in itertools.repeat(None, n):
+            for env, action, frames in zip(self.envs, actions, raw_frames):
+                frames.append(env.experience_frame(action))
+        self.preprocessor.process(
+            [f[0] for frames in raw_frames for f in frames],
+            [action.value for action in actions for _ in xrange(n)],
+            self.observations.reshape((-1,) + self.preprocessor.frame_shape))
+        experiences = [env.assemble_experience(action, frames, images)
+                       for env, action, frames, images in
+                       zip(self.envs, actions, raw_frames, self.observations)]
+        return experiences, self.observations
+
+    def get_random_transition_batch(self, num):
+        return self.envs[0].get_random_transition_batch(num)
+
+    def update_priorities(self, batch, td_errors):
+        self.envs[0].update_priorities(batch, td_errors)
+
+    def get_reward_from_experience(self, experience):
+        return self.envs[0].get_reward_from_experience(experience)
+
+    def get_state_from_experience(self, experience):
+        return self.envs[0].get_state_from_experience(experience)
+
+    def stop(self):
+        for env in self.envs:
+            env.stop()
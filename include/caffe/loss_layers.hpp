@@ -83,7 +83,7 @@ template <typename Dtype>
 class EuclideanLossLayer : public LossLayer<Dtype> {
  public:
   explicit EuclideanLossLayer(const LayerParameter& param)
-      : LossLayer<Dtype>(param), diff_() {}
+      : LossLayer<Dtype>(param), diff_(), normalizer_(1) {}
   virtual void FurtherSetUp(const vector<Blob<Dtype>*>& bottom,
       vector<Blob<Dtype>*>* top);
 
@@ -172,6 +172,47 @@ class MultinomialLogisticLossLayer : public LossLayer<Dtype> {
       const vector<bool>& propagate_down, vector<Blob<Dtype>*>* bottom);
 };
 
+/* QLossLayer
+  Q-learning loss of a batch of transitions. Takes the Q-values of every
+  action, the index of the action taken, its target value and, optionally,
+  a per-sample weight (e.g. an importance sampling correction). Only the
+  Q-value of the action taken is compared with its target. Samples with
+  zero weight are padding: they neither count towards N nor get a gradient.
+
+  loss = 1/(2N) \sum_i w_i (Q_i[a_i] - y_i)^2, N the samples with w_i != 0
+  Q_i[a_i]' = 1/N w_i (Q_i[a_i] - y_i), 0 for the other actions
+*/
+template <typename Dtype>
+class QLossLayer : public LossLayer<Dtype> {
+ public:
+  explicit QLossLayer(const LayerParameter& param)
+      : LossLayer<Dtype>(param), diff_(), normalizer_(1) {}
+  virtual void FurtherSetUp(const vector<Blob<Dtype>*>& bottom,
+      vector<Blob<Dtype>*>* top);
+
+  virtual inline LayerParameter_LayerType type() const {
+    return LayerParameter_LayerType_Q_LOSS;
+  }
+  virtual inline int ExactNumBottomBlobs() const { return -1; }
+  virtual inline int MinBottomBlobs() const { return 3; }
+  virtual inline int MaxBottomBlobs() const { return 4; }
+  // Only the Q-values can be backpropagated to.
+  virtual inline bool AllowForceBackward(const int bottom_index) const {
+    return bottom_index == 0;
+  }
+
+ protected:
+  virtual Dtype Forward_cpu(const vector<Blob<Dtype>*>& bottom,
+      vector<Blob<Dtype>*>* top);
+  virtual void Backward_cpu(const vector<Blob<Dtype>*>& top,
+      const vector<bool>& propagate_down, vector<Blob<Dtype>*>* bottom);
+
+  // The weighted TD error of the action taken in each sample, 0 elsewhere.
+  Blob<Dtype> diff_;
+  // N of the last Forward, the number of samples with nonzero weight.
+  int normalizer_;
+};
+
 /* SigmoidCrossEntropyLossLayer
 */
 template <typename Dtype>
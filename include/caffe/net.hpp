@@ -70,6 +70,9 @@ class Net {
   // trained layers from another net parameter instance.
   void CopyTrainedLayersFrom(const NetParameter& param);
   void CopyTrainedLayersFrom(const string trained_filename);
+  // Copies the parameter blobs of the layers this net shares by name with
+  // another Net into this net's own memory, e.g. to sync a target network.
+  void CopyTrainedLayersFrom(Net* other);
   // Writes the net to a proto.
   void ToProto(NetParameter* param, bool write_diff = false);
 
@@ -122,6 +125,9 @@ class Net {
       const string& layer_name);
 
  protected:
+  // Shares (copy false) or copies (copy true) the parameter blobs of the
+  // layers this net has in common, by name, with other.
+  void ShareOrCopyTrainedLayers(Net* other, bool copy);
   // Helpers for Init.
   // Append a new input or top blob to the net.
   void AppendTop(const NetParameter& param, const int layer_id,
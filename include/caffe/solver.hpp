@@ -23,9 +23,12 @@ class Solver {
   inline void OnlineUpdateSetup(const string resume_file) { OnlineUpdateSetup(resume_file.c_str()); }
   virtual void OnlineUpdateSetup(const char* resume_file = NULL);
   virtual void OnlineUpdate();
-  virtual void OnlineForward();
+  // Returns the loss of the forward pass.
+  virtual Dtype OnlineForward();
   virtual ~Solver() {}
   inline shared_ptr<Net<Dtype> > net() { return net_; }
+  inline int iter() const { return iter_; }
+  inline const SolverParameter& param() const { return param_; }
   inline const vector<shared_ptr<Net<Dtype> > >& test_nets() {
     return test_nets_;
   }
@@ -45,6 +45,25 @@ static void CheckFile(const string& filename) {
     f.close();
 }
 
+// Check that obj is a C contiguous float32 array of num values, such as one
+// value per sample of a batch, and return its data.
+static float* GetFloatVector(object obj, const string& name, int num) {
+  if (!PyArray_Check(obj.ptr())) {
+    throw std::runtime_error(name + " must be an ndarray");
+  }
+  PyArrayObject* arr = reinterpret_cast<PyArrayObject*>(obj.ptr());
+  if (!(PyArray_FLAGS(arr) & NPY_ARRAY_C_CONTIGUOUS)) {
+    throw std::runtime_error(name + " must be C contiguous");
+  }
+  if (PyArray_TYPE(arr) != NPY_FLOAT32) {
+    throw std::runtime_error(name + " must be float32");
+  }
+  if (PyArray_SIZE(arr) != num) {
+    throw std::runtime_error(name + " must have one value per sample");
+  }
+  return static_cast<float*>(PyArray_DATA(arr));
+}
+
 // wrap shared_ptr<Blob<float> > in a class that we construct in C++ and pass
 // to Python
 class CaffeBlob {
@@ -224,6 +243,19 @@ struct CaffeNet {
         PyArray_DIMS(data_arr)[0]);
   }
 
+  // Point this net's parameter blobs at those of the same-named layers in
+  // other, e.g. to evaluate a training net's weights at another batch size.
+  // Updates to other are seen here without copying.
+  void share_trained_layers_with(const CaffeNet& other) {
+    net_->ShareTrainedLayersWith(other.net_.get());
+  }
+
+  // Copy other's parameter blobs into this net's own, e.g. to sync a target
+  // network. The nets stay independent afterwards.
+  void copy_trained_layers_from(const CaffeNet& other) {
+    net_->CopyTrainedLayersFrom(other.net_.get());
+  }
+
   // save the network weights to binary proto for net surgeries.
   void save(string filename) {
     NetParameter net_param;
@@ -304,7 +336,77 @@ class CaffeSGDSolver {
     return solver_->OnlineUpdateSetup(resume_file);
   }
   void OnlineUpdate()      { return solver_->OnlineUpdate();      }
-  void OnlineForward()     { return solver_->OnlineForward();     }
+  float OnlineForward()    { return solver_->OnlineForward();     }
+
+  // One online Q-learning step in a single call. Binds states (N, channels,
+  // height, width) and the index of the action taken in each to the
+  // MemoryDataLayer, fills the targets and weights (None for all 1) inputs
+  // of the net's Q_LOSS layer, then runs the forward pass, loss gradient,
+  // backward pass and parameter update. N must be the MemoryDataLayer's
+  // batch size. Returns (Q-values, loss): the (N, actions) Q-values from
+  // before the update and the loss.
+  object OnlineTrainStep(object states_obj, object actions_obj,
+      object targets_obj, object weights_obj) {
+    Net<float>* net = solver_->net().get();
+    shared_ptr<MemoryDataLayer<float> > md_layer =
+      boost::dynamic_pointer_cast<MemoryDataLayer<float> >(net->layers()[0]);
+    if (!md_layer) {
+      throw std::runtime_error("online_train_step needs a MemoryDataLayer"
+          " as the first layer");
+    }
+    const int num_layers = net->layers().size();
+    int loss_id = 0;
+    while (loss_id != num_layers &&
+        net->layers()[loss_id]->type() != LayerParameter_LayerType_Q_LOSS) {
+      ++loss_id;
+    }
+    if (loss_id == num_layers) {
+      throw std::runtime_error("online_train_step needs a Q_LOSS layer");
+    }
+    const vector<Blob<float>*>& loss_bottom = net->bottom_vecs()[loss_id];
+    const int num = md_layer->batch_size();
+
+    if (!PyArray_Check(states_obj.ptr())) {
+      throw std::runtime_error("states must be an ndarray");
+    }
+    PyArrayObject* states_arr =
+        reinterpret_cast<PyArrayObject*>(states_obj.ptr());
+    net_->check_contiguous_array(states_arr, "states",
+        md_layer->datum_channels(), md_layer->datum_height(),
+        md_layer->datum_width());
+    if (PyArray_DIMS(states_arr)[0] != num) {
+      throw std::runtime_error("states must be one batch");
+    }
+    float* actions = GetFloatVector(actions_obj, "actions", num);
+    float* targets = GetFloatVector(targets_obj, "targets", num);
+    caffe_copy(num, targets, loss_bottom[2]->mutable_cpu_data());
+    if (loss_bottom.size() > 3) {
+      if (weights_obj.ptr() == Py_None) {
+        caffe_set(num, 1.f, loss_bottom[3]->mutable_cpu_data());
+      } else {
+        caffe_copy(num, GetFloatVector(weights_obj, "weights", num),
+            loss_bottom[3]->mutable_cpu_data());
+      }
+    }
+    // The net keeps pointing at states and actions, hold references.
+    net_->input_data_ = states_obj;
+    net_->input_labels_ = actions_obj;
+    md_layer->Reset(static_cast<float*>(PyArray_DATA(states_arr)), actions,
+        num);
+
+    float loss = solver_->OnlineForward();
+    const Blob<float>* q_blob = loss_bottom[0];
+    npy_intp dims[] = {num, q_blob->count() / num};
+    PyObject* q_values = PyArray_SimpleNew(2, dims, NPY_FLOAT32);
+    caffe_copy(q_blob->count(), q_blob->cpu_data(),
+        static_cast<float*>(PyArray_DATA(
+            reinterpret_cast<PyArrayObject*>(q_values))));
+    solver_->OnlineUpdate();
+    return boost::python::make_tuple(object(handle<>(q_values)), loss);
+  }
+  int iter() { return solver_->iter(); }
+  int snapshot_interval() { return solver_->param().snapshot(); }
+  string snapshot_prefix() { return solver_->param().snapshot_prefix(); }
   void SolveResume(const string& resume_file) {
     CheckFile(resume_file);
     return solver_->Solve(resume_file);
@@ -339,6 +441,8 @@ BOOST_PYTHON_MODULE(_caffe) {
       .add_property("raw_scale",    &CaffeNet::raw_scale_)
       .add_property("channel_swap", &CaffeNet::channel_swap_)
       .def("_set_input_arrays",     &CaffeNet::set_input_arrays)
+      .def("share_trained_layers_with", &CaffeNet::share_trained_layers_with)
+      .def("copy_trained_layers_from",  &CaffeNet::copy_trained_layers_from)
       .def("save",                  &CaffeNet::save);
 
   boost::python::class_<CaffeBlob, CaffeBlobWrap>(
@@ -360,9 +464,13 @@ BOOST_PYTHON_MODULE(_caffe) {
   boost::python::class_<CaffeSGDSolver, boost::noncopyable>(
       "SGDSolver", boost::python::init<string>())
       .add_property("net",               &CaffeSGDSolver::net)
+      .add_property("iter",              &CaffeSGDSolver::iter)
+      .add_property("snapshot_interval", &CaffeSGDSolver::snapshot_interval)
+      .add_property("snapshot_prefix",   &CaffeSGDSolver::snapshot_prefix)
       .def("solve",                      &CaffeSGDSolver::Solve)
       .def("online_update",              &CaffeSGDSolver::OnlineUpdate)
       .def("online_forward",             &CaffeSGDSolver::OnlineForward)
+      .def("online_train_step",          &CaffeSGDSolver::OnlineTrainStep)
       .def("online_update_setup",        &CaffeSGDSolver::OnlineUpdateSetup)
       .def("online_update_setup_resume", &CaffeSGDSolver::OnlineUpdateSetupResume)
       .def("solve",                      &CaffeSGDSolver::SolveResume);
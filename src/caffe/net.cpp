@@ -570,6 +570,16 @@ void Net<Dtype>::UpdateDebugInfo(const int param_id) {
 
 template <typename Dtype>
 void Net<Dtype>::ShareTrainedLayersWith(Net* other) {
+  ShareOrCopyTrainedLayers(other, false);
+}
+
+template <typename Dtype>
+void Net<Dtype>::CopyTrainedLayersFrom(Net* other) {
+  ShareOrCopyTrainedLayers(other, true);
+}
+
+template <typename Dtype>
+void Net<Dtype>::ShareOrCopyTrainedLayers(Net* other, bool copy) {
   int num_source_layers = other->layers().size();
   for (int i = 0; i < num_source_layers; ++i) {
     Layer<Dtype>* source_layer = other->layers()[i].get();
@@ -594,7 +604,12 @@ void Net<Dtype>::ShareTrainedLayersWith(Net* other) {
       CHECK_EQ(target_blobs[j]->channels(), source_blob->channels());
       CHECK_EQ(target_blobs[j]->height(), source_blob->height());
       CHECK_EQ(target_blobs[j]->width(), source_blob->width());
-      target_blobs[j]->ShareData(*source_blob);
+      if (copy) {
+        // A memcpy per blob, on the device of the current mode.
+        target_blobs[j]->CopyFrom(*source_blob);
+      } else {
+        target_blobs[j]->ShareData(*source_blob);
+      }
     }
   }
 }
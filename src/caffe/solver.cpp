@@ -245,7 +245,7 @@ void Solver<Dtype>::OnlineUpdateSetup(const char* resume_file) {
 }
 
 template <typename Dtype>
-void Solver<Dtype>::OnlineForward() {
+Dtype Solver<Dtype>::OnlineForward() {
   // CQ: Split from Solve because we need to be able to set the input
   // of the memory data layer, determine the q-loss in python, then
   // optionally backprop depending on whether we are training or just acting.
@@ -274,6 +274,7 @@ void Solver<Dtype>::OnlineForward() {
     iter_ % param_.snapshot() == 0) {
     Snapshot();
   }
+  return loss;
 }
 
 template <typename Dtype>
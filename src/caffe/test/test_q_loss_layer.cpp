@@ -0,0 +1,175 @@
+#include <cmath>
+#include <cstdlib>
+#include <cstring>
+#include <vector>
+
+#include "gtest/gtest.h"
+
+#include "caffe/blob.hpp"
+#include "caffe/common.hpp"
+#include "caffe/filler.hpp"
+#include "caffe/vision_layers.hpp"
+
+#include "caffe/test/test_caffe_main.hpp"
+#include "caffe/test/test_gradient_check_util.hpp"
+
+namespace caffe {
+
+template <typename TypeParam>
+class QLossLayerTest : public MultiDeviceTest<TypeParam> {
+  typedef typename TypeParam::Dtype Dtype;
+
+ protected:
+  QLossLayerTest()
+      : blob_bottom_data_(new Blob<Dtype>(10, 5, 1, 1)),
+        blob_bottom_action_(new Blob<Dtype>(10, 1, 1, 1)),
+        blob_bottom_target_(new Blob<Dtype>(10, 1, 1, 1)),
+        blob_bottom_weight_(new Blob<Dtype>(10, 1, 1, 1)),
+        blob_top_loss_(new Blob<Dtype>()) {
+    // fill the values
+    Caffe::set_random_seed(1701);
+    FillerParameter filler_param;
+    GaussianFiller<Dtype> filler(filler_param);
+    filler.Fill(this->blob_bottom_data_);
+    blob_bottom_vec_.push_back(blob_bottom_data_);
+    for (int i = 0; i < blob_bottom_action_->count(); ++i) {
+      blob_bottom_action_->mutable_cpu_data()[i] = caffe_rng_rand() % 5;
+    }
+    blob_bottom_vec_.push_back(blob_bottom_action_);
+    filler.Fill(this->blob_bottom_target_);
+    blob_bottom_vec_.push_back(blob_bottom_target_);
+    FillerParameter uniform_param;
+    uniform_param.set_min(0.1);
+    uniform_param.set_max(1);
+    UniformFiller<Dtype> uniform_filler(uniform_param);
+    uniform_filler.Fill(this->blob_bottom_weight_);
+  }
+  virtual ~QLossLayerTest() {
+    delete blob_bottom_data_;
+    delete blob_bottom_action_;
+    delete blob_bottom_target_;
+    delete blob_bottom_weight_;
+    delete blob_top_loss_;
+  }
+  Blob<Dtype>* const blob_bottom_data_;
+  Blob<Dtype>* const blob_bottom_action_;
+  Blob<Dtype>* const blob_bottom_target_;
+  Blob<Dtype>* const blob_bottom_weight_;
+  Blob<Dtype>* const blob_top_loss_;
+  vector<Blob<Dtype>*> blob_bottom_vec_;
+  vector<Blob<Dtype>*> blob_top_vec_;
+};
+
+TYPED_TEST_CASE(QLossLayerTest, TestDtypesAndDevices);
+
+TYPED_TEST(QLossLayerTest, TestForward) {
+  typedef typename TypeParam::Dtype Dtype;
+  this->blob_top_vec_.push_back(this->blob_top_loss_);
+  LayerParameter layer_param;
+  QLossLayer<Dtype> layer(layer_param);
+  layer.SetUp(this->blob_bottom_vec_, &this->blob_top_vec_);
+  Dtype loss = layer.Forward(this->blob_bottom_vec_, &this->blob_top_vec_);
+  // Only the Q-value of the action taken counts.
+  const Dtype* data = this->blob_bottom_data_->cpu_data();
+  const int num = this->blob_bottom_data_->num();
+  const int dim = this->blob_bottom_data_->count() / num;
+  Dtype expected_loss = 0;
+  for (int i = 0; i < num; ++i) {
+    const int action =
+        static_cast<int>(this->blob_bottom_action_->cpu_data()[i]);
+    const Dtype td_error = data[i * dim + action] -
+        this->blob_bottom_target_->cpu_data()[i];
+    expected_loss += td_error * td_error;
+  }
+  expected_loss /= num * Dtype(2);
+  EXPECT_NEAR(expected_loss, loss, 1e-5);
+  EXPECT_NEAR(expected_loss, this->blob_top_loss_->cpu_data()[0], 1e-5);
+}
+
+TYPED_TEST(QLossLayerTest, TestZeroWeightIsPadding) {
+  typedef typename TypeParam::Dtype Dtype;
+  // The last 4 samples pad a batch of 6.
+  const int valid_num = 6;
+  Dtype* weights = this->blob_bottom_weight_->mutable_cpu_data();
+  for (int i = valid_num; i < this->blob_bottom_weight_->count(); ++i) {
+    weights[i] = 0;
+  }
+  this->blob_bottom_vec_.push_back(this->blob_bottom_weight_);
+  this->blob_top_vec_.push_back(this->blob_top_loss_);
+  LayerParameter layer_param;
+  QLossLayer<Dtype> layer(layer_param);
+  layer.SetUp(this->blob_bottom_vec_, &this->blob_top_vec_);
+  Dtype loss = layer.Forward(this->blob_bottom_vec_, &this->blob_top_vec_);
+  vector<bool> propagate_down(this->blob_bottom_vec_.size(), false);
+  propagate_down[0] = true;
+  layer.Backward(this->blob_top_vec_, propagate_down,
+      &this->blob_bottom_vec_);
+  const Dtype* data = this->blob_bottom_data_->cpu_data();
+  const Dtype* diff = this->blob_bottom_data_->cpu_diff();
+  const int num = this->blob_bottom_data_->num();
+  const int dim = this->blob_bottom_data_->count() / num;
+  Dtype expected_loss = 0;
+  for (int i = 0; i < num; ++i) {
+    const int action =
+        static_cast<int>(this->blob_bottom_action_->cpu_data()[i]);
+    const Dtype td_error = data[i * dim + action] -
+        this->blob_bottom_target_->cpu_data()[i];
+    expected_loss += weights[i] * td_error * td_error;
+    EXPECT_NEAR(weights[i] * td_error / valid_num, diff[i * dim + action],
+        1e-5);
+  }
+  expected_loss /= valid_num * Dtype(2);
+  EXPECT_NEAR(expected_loss, loss, 1e-5);
+}
+
+TYPED_TEST(QLossLayerTest, TestBackwardMasksOtherActions) {
+  typedef typename TypeParam::Dtype Dtype;
+  LayerParameter layer_param;
+  QLossLayer<Dtype> layer(layer_param);
+  layer.SetUp(this->blob_bottom_vec_, &this->blob_top_vec_);
+  layer.Forward(this->blob_bottom_vec_, &this->blob_top_vec_);
+  vector<bool> propagate_down(this->blob_bottom_vec_.size(), false);
+  propagate_down[0] = true;
+  layer.Backward(this->blob_top_vec_, propagate_down,
+      &this->blob_bottom_vec_);
+  const Dtype* data = this->blob_bottom_data_->cpu_data();
+  const Dtype* diff = this->blob_bottom_data_->cpu_diff();
+  const int num = this->blob_bottom_data_->num();
+  const int dim = this->blob_bottom_data_->count() / num;
+  for (int i = 0; i < num; ++i) {
+    const int action =
+        static_cast<int>(this->blob_bottom_action_->cpu_data()[i]);
+    for (int j = 0; j < dim; ++j) {
+      if (j == action) {
+        const Dtype td_error = data[i * dim + j] -
+            this->blob_bottom_target_->cpu_data()[i];
+        EXPECT_NEAR(td_error / num, diff[i * dim + j], 1e-5);
+      } else {
+        EXPECT_EQ(0, diff[i * dim + j]);
+      }
+    }
+  }
+}
+
+TYPED_TEST(QLossLayerTest, TestGradient) {
+  typedef typename TypeParam::Dtype Dtype;
+  LayerParameter layer_param;
+  QLossLayer<Dtype> layer(layer_param);
+  layer.SetUp(this->blob_bottom_vec_, &this->blob_top_vec_);
+  GradientChecker<Dtype> checker(1e-2, 1e-2, 1701);
+  checker.CheckGradientSingle(&layer, &(this->blob_bottom_vec_),
+      &(this->blob_top_vec_), 0, -1, -1);
+}
+
+TYPED_TEST(QLossLayerTest, TestGradientWeighted) {
+  typedef typename TypeParam::Dtype Dtype;
+  this->blob_bottom_vec_.push_back(this->blob_bottom_weight_);
+  LayerParameter layer_param;
+  QLossLayer<Dtype> layer(layer_param);
+  layer.SetUp(this->blob_bottom_vec_, &this->blob_top_vec_);
+  GradientChecker<Dtype> checker(1e-2, 1e-2, 1701);
+  checker.CheckGradientSingle(&layer, &(this->blob_bottom_vec_),
+      &(this->blob_top_vec_), 0, -1, -1);
+}
+
+}  // namespace caffe